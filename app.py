@@ -1,15 +1,64 @@
 import streamlit as st
 from streamlit_folium import st_folium
-import folium
-from folium import plugins
-from db import get_center, get_shops, get_all_centers
+from data_cache import (
+    get_cached_center, get_cached_shop, get_cached_centers, get_cached_shop_analysis, get_cached_risk_counts,
+    get_viewport_shops, get_nearest_center, get_shop_index, find_shop_at, invalidate_cache, start_change_listener,
+)
 import json
+import uuid
+from db import get_setting, get_pool_stats
+from metrics import begin_rerun, finish_rerun, prometheus_text, span
+from map_layers import (
+    build_base_map, build_selection_layer, build_shop_layer, prepare_center_layer, prepare_shop_layer,
+    shop_id_from_tooltip,
+)
+from geo import bbox_tiles, estimate_bounds, expand_bbox
+
+# Upper bound on shop markers fetched for the map
+MAX_MAP_SHOPS = 5000
+
+# Coverage radius drawn (and evaluated) around the focused center
+COVERAGE_RADIUS_KM = 2.0
+
+# "Auto" marker mode draws one GeoJSON layer, switching to clustering above this many visible shops
+CLUSTER_THRESHOLD = int(get_setting("MAP_CLUSTER_THRESHOLD", 500))
+
+# Map widget size and initial zoom; shops are loaded for the visible viewport plus a margin
+MAP_WIDTH, MAP_HEIGHT = 1000, 600
+DEFAULT_ZOOM = 13
+VIEWPORT_MARGIN = 0.25
+VIEWPORT_MAX_TILES = 16
 
 st.set_page_config(page_title="Walmart Risk Detection Map", layout="wide")
 
+# Per-rerun timing and query instrumentation (optional JSON-lines / Prometheus exports)
+METRICS_EXPORTS = {
+    "jsonl_path": get_setting("METRICS_JSONL_PATH"),
+    "prometheus_path": get_setting("METRICS_PROM_PATH"),
+}
+if "metrics_session" not in st.session_state:
+    st.session_state.metrics_session = uuid.uuid4().hex[:12]
+if st.session_state.get("rerun_trace") is not None:
+    # st.rerun() / st.stop() ended the previous run before it reached the end of the script
+    finish_rerun(st.session_state.rerun_trace, status="interrupted", **METRICS_EXPORTS)
+st.session_state.rerun_trace = begin_rerun(st.session_state.metrics_session)
+
 st.title("🏪 Walmart Risk Detection Map")
 st.markdown("---")
 
+# Shared data cache is refreshed early when the database reports changes
+start_change_listener()
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def get_shop_layer(marker_mode, shops_key, _shops):
+    """Prepared shop layer shared across reruns and sessions; shops_key fingerprints the unhashed rows"""
+    return prepare_shop_layer(marker_mode, _shops)
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def get_center_layer(center_id, centers_key, _centers):
+    """Prepared markers of the other centers shared across reruns and sessions; centers_key fingerprints the rows"""
+    return prepare_center_layer(_centers, center_id)
+
 # Initialize session state for selected shop
 if 'selected_shop_id' not in st.session_state:
     st.session_state.selected_shop_id = None
@@ -32,6 +81,14 @@ with st.sidebar:
     show_medium = st.checkbox("Medium Risk", value=True) 
     show_low = st.  checkbox("Low Risk", value=True)
     
+    # Marker rendering mode
+    marker_mode = st.radio(
+        "Shop Markers:",
+        ["Auto", "GeoJSON", "Clustered", "Individual"],
+        horizontal=True,
+        help=f"Auto uses a single GeoJSON layer and clusters markers when more than {CLUSTER_THRESHOLD} shops are visible"
+    )
+    
     # Legend
     st.subheader("📍 Map Legend")
     st.markdown("""
@@ -42,10 +99,15 @@ with st.sidebar:
     - 🟢 **Green**: Low Risk Shop
     - 🟣 **Purple Line**: Path to Nearest Center (with distance)
     """)
+
+    if st.button("🔄 Refresh Data", help="Reload centers and shops from the database"):
+        invalidate_cache()
+        st.rerun()
     
 
 
-center = get_center(center_id)
+with span("app.load_data"):
+    center = get_cached_center(center_id)
 
 if not center:
     st.error("❌ Walmart Center not found! Please check the Center ID.")
@@ -53,20 +115,34 @@ if not center:
     st.stop()
 
 center_id, center_name, center_lat, center_lon = center
-shops = get_shops()
 
-# Filter shops based on risk level selection
-filtered_shops = []
+# Current map viewport (reset whenever the focused center changes)
+viewport = st.session_state.get("viewport")
+if viewport is None or viewport["center_id"] != center_id:
+    viewport = {
+        "center_id": center_id,
+        "lat": float(center_lat),
+        "lon": float(center_lon),
+        "zoom": DEFAULT_ZOOM,
+        "bounds": None,
+    }
+    st.session_state.viewport = viewport
+view_bounds = viewport["bounds"] or estimate_bounds(viewport["lat"], viewport["lon"], viewport["zoom"], MAP_WIDTH, MAP_HEIGHT)
+view_bbox = expand_bbox(view_bounds, VIEWPORT_MARGIN)
+
+# Filter shops based on risk level selection and viewport (done in SQL, cached per tile)
 risk_filter = {
     'high': show_high,
     'medium': show_medium, 
     'low': show_low
 }
-
-for shop in shops:
-    shop_risk = shop[4].lower()
-    if risk_filter.get(shop_risk, True):
-        filtered_shops.append(shop)
+selected_risks = [level for level, shown in risk_filter.items() if shown]
+with span("app.viewport_shops"):
+    filtered_shops = get_viewport_shops(
+        selected_risks, view_bbox, viewport["zoom"], limit=MAX_MAP_SHOPS, max_tiles=VIEWPORT_MAX_TILES
+    )
+if marker_mode == "Auto":
+    marker_mode = "Clustered" if len(filtered_shops) > CLUSTER_THRESHOLD else "GeoJSON"
 
 # Main content area
 col1, col2 = st.columns([3, 1])
@@ -75,235 +151,125 @@ with col1:
     st.markdown(f"### 🎯 Focus: **{center_name}** (ID: {center_id})")
     st.markdown(f"📍 **Coordinates:** {center_lat:.4f}, {center_lon:.4f}")
     
-    # Map tiles configuration
-    tile_mapping = {
-        "OpenStreetMap": "OpenStreetMap",
-        "CartoDB Positron": "CartoDB positron", 
-        "CartoDB Dark_Matter": "CartoDB dark_matter"
-    }
-    
-    # Create the map with enhanced styling
-    m = folium.Map(
-        location=[center_lat, center_lon], 
-        zoom_start=13,
-        tiles=tile_mapping[map_style]
-    )
-    
-    # Add custom CSS for better styling
-    m.get_root().html.add_child(folium.Element("""
-    <style>
-    .leaflet-popup-content-wrapper {
-        border-radius: 10px;
-        box-shadow: 0 4px 8px rgba(0,0,0,0.3);
-    }
-    .leaflet-popup-content {
-        font-family: 'Arial', sans-serif;
-        line-height: 1.4;
-    }
-    </style>
-    """))
-    
-    # Add Walmart center marker with custom styling
-    walmart_popup = f"""
-    <div style='font-family: Arial; width: 200px;'>
-        <h4 style='color: #0071ce; margin: 0;'>🏪 {center_name}</h4>
-        <hr style='margin: 5px 0;'>
-        <p><b>Center ID:</b> {center_id}</p>
-        <p><b>Type:</b> Walmart Center</p>
-        <p><b>Status:</b> <span style='color: green;'>Active</span></p>
-    </div>
-    """
-    
-    folium.Marker(
-        [center_lat, center_lon],
-        tooltip=f"🏪 Walmart Center: {center_name}",
-        popup=folium.Popup(walmart_popup, max_width=250),
-        icon=folium.Icon(
-            color="blue", 
-            icon="shopping-cart", 
-            prefix="fa"
-        )
-    ).add_to(m)    # Enhanced risk color and icon mapping
-    RISK_CONFIG = {
-        "high": {"color": "red", "icon": "exclamation-triangle", "emoji": "🔴"},
-        "medium": {"color": "orange", "icon": "exclamation-circle", "emoji": "🟡"}, 
-        "low": {"color": "green", "icon": "check-circle", "emoji": "🟢"}
-    }
-    
-    # Add shop markers with enhanced popups and click detection
-    for shop_id, shop_name, shop_lat, shop_lon, risk, analysis in filtered_shops:
-        # Convert coordinates to float to avoid decimal type issues
-        shop_lat_float = float(shop_lat)
-        shop_lon_float = float(shop_lon)
-        risk_lower = risk.lower()
-        config = RISK_CONFIG.get(risk_lower, {"color": "gray", "icon": "question", "emoji": "⚪"})
-        
-        # Create detailed popup with click detection
-        shop_popup = f"""
-        <div style='font-family: Arial; width: 250px;' data-shop-id='{shop_id}'>
-            <h4 style='color: {config["color"]}; margin: 0;'>{config["emoji"]} {shop_name}</h4>
-            <hr style='margin: 5px 0;'>
-            <p><b>Shop ID:</b> {shop_id}</p>
-            <p><b>Risk Level:</b> <span style='color: {config["color"]}; font-weight: bold;'>{risk.upper()}</span></p>
-            <p><b>Location:</b> {shop_lat_float:.4f}, {shop_lon_float:.4f}</p>
-            <div style='background-color: #f0f0f0; padding: 8px; border-radius: 5px; margin-top: 8px;'>
-                <b>Analysis Preview:</b><br>
-                <small>{analysis[:100]}{"..." if len(analysis) > 100 else ""}</small>
-            </div>
-            <p style='font-size: 11px; color: #666; margin-top: 8px;'>🔍 Click marker to show paths to all centers</p>
-        </div>
-        """
-        
-        # Add shop marker
-        marker = folium.Marker(
-            [shop_lat_float, shop_lon_float],
-            tooltip=f"{config['emoji']} {shop_name} (Risk: {risk}) - Click for analysis",
-            popup=folium.Popup(shop_popup, max_width=300),
-            icon=folium.Icon(
-                color=config["color"], 
-                icon=config["icon"], 
-                prefix="fa"
-            )
-        )
-        marker.add_to(m)
-    
     # Get all centers for path visualization
-    all_centers = get_all_centers()
-    
-    # Add all other Walmart centers as smaller markers
-    for center_id_other, center_name_other, center_lat_other, center_lon_other in all_centers:
-        if center_id_other != int(center_id):  # Don't duplicate the main center
-            folium.Marker(
-                [center_lat_other, center_lon_other],
-                tooltip=f"🏪 {center_name_other}",
-                popup=f"<b>{center_name_other}</b><br>Center ID: {center_id_other}",
-                icon=folium.Icon(
-                    color="lightblue", 
-                    icon="shopping-cart", 
-                    prefix="fa"
-                )
-            ).add_to(m)
+    all_centers = get_cached_centers()
     
-    # If a shop is selected, show path to nearest center only
-    if st.session_state.selected_shop_id:
-        selected_shop = next((s for s in filtered_shops if s[0] == st.session_state.selected_shop_id), None)
-        if selected_shop:
-            # Convert coordinates to float
-            shop_lat_path = float(selected_shop[2])
-            shop_lon_path = float(selected_shop[3])
-            
-            # Calculate distance function
-            import math
-            def calculate_distance(lat1, lon1, lat2, lon2):
-                lat1, lon1, lat2, lon2 = float(lat1), float(lon1), float(lat2), float(lon2)
-                R = 6371  # Earth's radius in kilometers
-                dlat = math.radians(lat2 - lat1)
-                dlon = math.radians(lon2 - lon1)
-                a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
-                c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-                return R * c
-            
-            # Find nearest center
-            nearest_center = None
-            min_distance = float('inf')
-            
-            for center_id_path, center_name_path, center_lat_path, center_lon_path in all_centers:
-                center_lat_float = float(center_lat_path)
-                center_lon_float = float(center_lon_path)
-                distance = calculate_distance(shop_lat_path, shop_lon_path, center_lat_float, center_lon_float)
-                
-                if distance < min_distance:
-                    min_distance = distance
-                    nearest_center = (center_id_path, center_name_path, center_lat_float, center_lon_float)
-            
-            # Draw line only to nearest center with distance on the path
-            if nearest_center:
-                center_id_path, center_name_path, center_lat_float, center_lon_float = nearest_center
-                
-                folium.PolyLine(
-                    locations=[[shop_lat_path, shop_lon_path], [center_lat_float, center_lon_float]],
-                    color='purple',
-                    weight=4,
-                    opacity=0.8,
-                    popup=f"<b>📍 Distance: {min_distance:.2f} km</b><br>From: {selected_shop[1]}<br>To: {center_name_path}",
-                    tooltip=f"Distance: {min_distance:.2f} km"
-                ).add_to(m)
-                
-                # Add a marker at the midpoint showing distance
-                mid_lat = (shop_lat_path + center_lat_float) / 2
-                mid_lon = (shop_lon_path + center_lon_float) / 2
-                
-                folium.Marker(
-                    [mid_lat, mid_lon],
-                    popup=f"<b>📏 {min_distance:.2f} km</b>",
-                    tooltip=f"{min_distance:.2f} km",
-                    icon=folium.DivIcon(
-                        html=f'<div style="background-color: purple; color: white; padding: 2px 6px; border-radius: 3px; font-size: 12px; font-weight: bold;">{min_distance:.2f} km</div>',
-                        icon_size=(80, 20),
-                        icon_anchor=(40, 10)
-                    )
-                ).add_to(m)
-    
-    # Add a circle around the Walmart center to show coverage area
-    folium.Circle(
-        location=[center_lat, center_lon],
-        radius=2000,  # 2km radius
-        popup=f"Coverage Area (2km radius)",
-        color="#0071ce",
-        fill=True,
-        opacity=0.3,
-        fillOpacity=0.1
-    ).add_to(m)
+    # Static base map: the same script on every rerun, so the browser keeps it mounted
+    with span("app.base_map"):
+        center_layer = get_center_layer(center_id, hash(all_centers), all_centers)
+        m = build_base_map(center, map_style, DEFAULT_ZOOM, center_layer, COVERAGE_RADIUS_KM)
+
+    # Shops in view as a dynamic layer around the cached shop layer data
+    with span("app.shop_layer"):
+        shop_layer = get_shop_layer(marker_mode, hash(tuple(filtered_shops)), filtered_shops)
+        dynamic_layers = [build_shop_layer(marker_mode, shop_layer)]
     
-    # Add plugins for better functionality
-    plugins.Fullscreen().add_to(m)
-    plugins.MeasureControl().add_to(m)
+    # If a shop is selected, show path to nearest center only (dynamic layer on top of the base map)
+    with span("app.selection_layer"):
+        if st.session_state.selected_shop_id:
+            selected_shop = get_cached_shop(st.session_state.selected_shop_id)
+            if selected_shop:
+                # Nearest center (precomputed assignment, falling back to the KD-tree locator)
+                nearest_center, min_distance = get_nearest_center(selected_shop[0], selected_shop[2], selected_shop[3])
+                if nearest_center:
+                    dynamic_layers.append(build_selection_layer(selected_shop, nearest_center, min_distance))
     
     # Display the map
     st.markdown("### 🗺️ Interactive Risk Detection Map")
     
     # Show current selection status
     if st.session_state.selected_shop_id:
-        selected_shop_info = next((s for s in filtered_shops if s[0] == st.session_state.selected_shop_id), None)
+        selected_shop_info = get_cached_shop(st.session_state.selected_shop_id)
         if selected_shop_info:
             st.info(f"🎯 **Selected:** {selected_shop_info[1]} (ID: {st.session_state.selected_shop_id}) - Purple path to nearest center is visible!")
     else:
         st.info("👆 Click any shop marker or use the buttons below to see path to nearest Walmart center with distance")
     
-    # Create a unique key based on selected shop to force map refresh
-    map_key = f"main_map_{st.session_state.selected_shop_id or 'none'}"
-    map_data = st_folium(m, width=1000, height=600, returned_objects=["last_object_clicked"], key=map_key)
+    # Stable key: selection, viewport and marker mode changes only swap the dynamic layers in the
+    # mounted map (the base map loads every mode's plugins), so Auto switching modes keeps the view.
+    map_key = "main_map"
+    # st_folium remounts (and restarts its click count) whenever the base map script changes
+    map_mount = (map_key, center_id, map_style, hash(center_layer))
+    with span("app.st_folium"):
+        map_data = st_folium(
+            m,
+            width=MAP_WIDTH,
+            height=MAP_HEIGHT,
+            returned_objects=[
+                "last_object_clicked", "last_object_clicked_tooltip", "last_object_clicked_count",
+                "bounds", "zoom", "center",
+            ],
+            feature_group_to_add=dynamic_layers,
+            key=map_key
+        )
+    
+    # Track the viewport; only rerun when it needs shops from different tiles.
+    # "center" is only present once the browser has reported its real view
+    # (before that st_folium returns the bounds of every marker on the map).
+    if map_data and map_data.get("center") and map_data.get("bounds"):
+        south_west, north_east = map_data["bounds"]["_southWest"], map_data["bounds"]["_northEast"]
+        new_bounds = (south_west["lat"], south_west["lng"], north_east["lat"], north_east["lng"])
+        new_zoom = map_data.get("zoom") or viewport["zoom"]
+        new_center = map_data["center"]
+        old_tiles = bbox_tiles(view_bbox, viewport["zoom"], VIEWPORT_MAX_TILES)
+        new_tiles = bbox_tiles(expand_bbox(new_bounds, VIEWPORT_MARGIN), new_zoom, VIEWPORT_MAX_TILES)
+        st.session_state.viewport = {
+            "center_id": center_id,
+            "lat": new_center["lat"],
+            "lon": new_center["lng"],
+            "zoom": new_zoom,
+            "bounds": new_bounds,
+        }
+        if new_tiles != old_tiles:
+            st.rerun()
 
-with col2:
+with col2, span("app.statistics"):
     st.markdown("### 📊 Map Statistics")
     
-    total_shops = len(shops)
+    # Risk counts come from SQL GROUP BY queries, cached until the data changes
+    risk_counts = get_cached_risk_counts()
+    total_shops = sum(risk_counts.values())
     filtered_count = len(filtered_shops)
     
     st.metric("Total Shops", total_shops)
-    st.metric("Visible Shops", filtered_count)
+    st.metric("Shops in View", filtered_count)
+    if filtered_count >= MAX_MAP_SHOPS:
+        st.caption(f"Map limited to the first {MAX_MAP_SHOPS} matching shops")
     
     # Risk distribution
-    if shops:
-        risk_counts = {'high': 0, 'medium': 0, 'low': 0}
-        for shop in shops:
-            risk_level = shop[4].lower()
-            if risk_level in risk_counts:
-                risk_counts[risk_level] += 1
-        
+    if total_shops:
         st.markdown("#### Risk Distribution")
-        st.markdown(f"🔴 High: {risk_counts['high']}")
-        st.markdown(f"🟡 Medium: {risk_counts['medium']}")
-        st.markdown(f"🟢 Low: {risk_counts['low']}")
+        st.markdown(f"🔴 High: {risk_counts.get('high', 0)}")
+        st.markdown(f"🟡 Medium: {risk_counts.get('medium', 0)}")
+        st.markdown(f"🟢 Low: {risk_counts.get('low', 0)}")
         
         # Calculate risk percentage
-        high_percentage = (risk_counts['high'] / total_shops) * 100 if total_shops > 0 else 0
+        high_percentage = (risk_counts.get('high', 0) / total_shops) * 100
         if high_percentage > 30:
             st.warning(f"⚠️ High risk shops: {high_percentage:.1f}%")
         elif high_percentage > 15:
             st.info(f"ℹ️ High risk shops: {high_percentage:.1f}%")
         else:
-            st.success(f"✅ High risk shops: {high_percentage:.1f}%")# Handle marker clicks for detailed analysis and path visualization
+            st.success(f"✅ High risk shops: {high_percentage:.1f}%")
+    
+    # Shops whose nearest center is the focused one (needs the assignments from assign_centers.py)
+    center_counts = get_cached_risk_counts(center_id=center_id)
+    if center_counts:
+        st.markdown("#### 🏪 Served by This Center")
+        st.markdown(
+            f"{sum(center_counts.values())} shops - 🔴 {center_counts.get('high', 0)} "
+            f"· 🟡 {center_counts.get('medium', 0)} · 🟢 {center_counts.get('low', 0)}"
+        )
+    
+    # Shops inside the focused center's coverage radius (KD-tree radius query)
+    covered_shops = get_shop_index().within_radius(float(center_lat), float(center_lon), COVERAGE_RADIUS_KM)
+    st.markdown(f"#### 🧭 Coverage ({COVERAGE_RADIUS_KM:g} km)")
+    st.metric("Shops in Coverage", len(covered_shops))
+    for (_, covered_name, _, _, covered_risk, _), covered_distance in covered_shops[:10]:
+        covered_emoji = {"high": "🔴", "medium": "🟡", "low": "🟢"}.get(covered_risk.lower(), "⚪")
+        st.markdown(f"{covered_emoji} {covered_name} - {covered_distance:.2f} km")
+    if len(covered_shops) > 10:
+        st.caption(f"...and {len(covered_shops) - 10} more")# Handle marker clicks for detailed analysis and path visualization
 st.markdown("---")
 
 # Add shop selection buttons for easier interaction
@@ -312,88 +278,44 @@ if filtered_shops:
     col1, col2, col3, col4 = st.columns(4)
     
     # Show first few shops as buttons for easy testing
-    for i, (shop_id, shop_name, shop_lat, shop_lon, risk, analysis) in enumerate(filtered_shops[:8]):
+    for i, (shop_id, shop_name, shop_lat, shop_lon, risk, _) in enumerate(filtered_shops[:8]):
         with [col1, col2, col3, col4][i % 4]:
             risk_emoji = {"high": "🔴", "medium": "🟡", "low": "🟢"}.get(risk.lower(), "⚪")
             if st.button(f"{risk_emoji} {shop_name[:15]}...", key=f"shop_{shop_id}"):
                 st.session_state.selected_shop_id = shop_id
                 st.rerun()
 
-# Check if a marker was clicked on the map
-if map_data and map_data.get("last_object_clicked"):
-    clicked_data = map_data["last_object_clicked"]
-    popup_content = clicked_data.get("popup", "")
-    lat_clicked = clicked_data.get("lat")
-    lng_clicked = clicked_data.get("lng")
-    
-    # Try to find shop by coordinates if popup parsing fails
-    if lat_clicked and lng_clicked:
-        # Find closest shop to clicked coordinates
-        min_distance = float('inf')
-        closest_shop_id = None
-        
-        for shop_id, shop_name, shop_lat, shop_lon, risk, analysis in filtered_shops:
-            # Convert decimal coordinates to float for calculation
-            shop_lat_float = float(shop_lat)
-            shop_lon_float = float(shop_lon)
-            distance = abs(shop_lat_float - lat_clicked) + abs(shop_lon_float - lng_clicked)
-            if distance < min_distance and distance < 0.001:  # Very close tolerance
-                min_distance = distance
-                closest_shop_id = shop_id
-        
-        if closest_shop_id and closest_shop_id != st.session_state.selected_shop_id:
-            st.session_state.selected_shop_id = closest_shop_id
-            st.rerun()
-    
-    # Also try popup parsing as backup
-    if popup_content and "Shop ID:" in popup_content:
-        try:
-            # Extract shop ID from popup HTML
-            import re
-            shop_id_match = re.search(r'<b>Shop ID:</b>\s*(\d+)', popup_content)
-            if shop_id_match:
-                shop_id = int(shop_id_match.group(1))
-                if st.session_state.selected_shop_id != shop_id:
-                    st.session_state.selected_shop_id = shop_id
-                    st.rerun()
-        except (ValueError, AttributeError):
-            pass  # Silently handle parsing errors
+# Check if a marker was clicked on the map. The map stays mounted, so the last click is
+# returned on every rerun; only act on new clicks (the click count changes). The count
+# starts over on a remount, so it is compared per mounted map.
+click_count = map_data.get("last_object_clicked_count") if map_data else None
+if click_count and (map_mount, click_count) != st.session_state.get("handled_click"):
+    st.session_state.handled_click = (map_mount, click_count)
+    clicked_data = map_data.get("last_object_clicked") or {}
+
+    # Shop markers carry their id in the tooltip; fall back to the shop at the clicked position
+    clicked_shop_id = shop_id_from_tooltip(map_data.get("last_object_clicked_tooltip"))
+    if clicked_shop_id is None and clicked_data.get("lat") is not None and clicked_data.get("lng") is not None:
+        clicked_shop = find_shop_at(clicked_data["lat"], clicked_data["lng"])
+        clicked_shop_id = clicked_shop[0] if clicked_shop else None
+
+    if clicked_shop_id is not None and clicked_shop_id != st.session_state.selected_shop_id:
+        st.session_state.selected_shop_id = clicked_shop_id
+        st.rerun()
 
 # Show detailed analysis if a shop is selected
 if st.session_state.selected_shop_id:
     # Find the selected shop
-    selected_shop = next((s for s in shops if s[0] == st.session_state.selected_shop_id), None)
+    selected_shop = get_cached_shop(st.session_state.selected_shop_id)
     if selected_shop:
-        _, shop_name, shop_lat, shop_lon, risk, analysis = selected_shop
+        shop_id, shop_name, shop_lat, shop_lon, risk, _ = selected_shop
         
         # Create detailed analysis section
         st.markdown("## 🔍 Detailed Shop Analysis & Nearest Center")
         
         # Calculate nearest center for display
-        import math
-        def calculate_distance(lat1, lon1, lat2, lon2):
-            lat1, lon1, lat2, lon2 = float(lat1), float(lon1), float(lat2), float(lon2)
-            R = 6371  # Earth's radius in kilometers
-            dlat = math.radians(lat2 - lat1)
-            dlon = math.radians(lon2 - lon1)
-            a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
-            c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-            return R * c
-        
-        # Find nearest center
-        nearest_center = None
-        min_distance = float('inf')
-        
-        for center_id_dist, center_name_dist, center_lat_dist, center_lon_dist in all_centers:
-            center_lat_float = float(center_lat_dist)
-            center_lon_float = float(center_lon_dist)
-            shop_lat_float = float(shop_lat)
-            shop_lon_float = float(shop_lon)
-            distance = calculate_distance(shop_lat_float, shop_lon_float, center_lat_float, center_lon_float)
-            
-            if distance < min_distance:
-                min_distance = distance
-                nearest_center = (center_name_dist, distance)
+        nearest_row, min_distance = get_nearest_center(shop_id, shop_lat, shop_lon)
+        nearest_center = (nearest_row[1], min_distance) if nearest_row else None
         
         if nearest_center:
             st.info(f"🛣️ Nearest center: **{nearest_center[0]}** - Distance: **{nearest_center[1]:.2f} km**")
@@ -414,7 +336,7 @@ if st.session_state.selected_shop_id:
         
         # Analysis in an expandable section
         with st.expander("📊 Full Analysis Details", expanded=True):
-            st.markdown(analysis)
+            st.markdown(get_cached_shop_analysis(shop_id))
         
         # Action buttons
         col1, col2, col3, col4 = st.columns(4)
@@ -438,4 +360,32 @@ st.markdown("""
 <div style='text-align: center; color: #666; font-size: 14px;'>
     🏪 Walmart Risk Detection System | Built for Hackathon 2025
 </div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+trace = finish_rerun(st.session_state.rerun_trace, **METRICS_EXPORTS)
+st.session_state.rerun_trace = None
+
+# Optional debug panel: DEBUG_PANEL=1 in the settings or ?debug=1 in the URL
+if str(get_setting("DEBUG_PANEL", "")).lower() in ("1", "true") or st.query_params.get("debug") == "1":
+    with st.sidebar.expander("🐞 Debug: Last Rerun", expanded=True):
+        queries, rows, nbytes, query_seconds = trace.query_totals()
+        st.markdown(
+            f"**{trace.duration * 1000:.1f} ms** total · {queries} queries "
+            f"({query_seconds * 1000:.1f} ms) · {rows} rows · ~{nbytes / 1024:.1f} KiB"
+        )
+        st.dataframe(
+            [{"Stage": "  " * depth + name, "ms": round(duration * 1000, 2)}
+             for name, depth, _, duration in sorted(trace.spans, key=lambda s: s[2])],
+            hide_index=True
+        )
+        if trace.queries:
+            st.dataframe(
+                [{"Call": call, "Rows": count, "Bytes": size, "ms": round(seconds * 1000, 2)}
+                 for call, count, size, seconds in trace.queries],
+                hide_index=True
+            )
+        try:
+            st.json(get_pool_stats(), expanded=False)
+        except Exception as e:
+            st.caption(f"Pool stats unavailable: {e}")
+        st.download_button("⬇️ Prometheus metrics", prometheus_text(), file_name="metrics.prom", mime="text/plain")
\ No newline at end of file
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Nearest-center assignment job for Walmart Risk Detection System
+Stores each shop's nearest Walmart center and great-circle distance in the
+shop_nearest_center table so the app can read the answer instead of computing it.
+
+Runs incrementally: only shops that are new, moved, or assigned to a center that
+moved or disappeared are fully recomputed, and added/moved centers are checked
+against the remaining shops. Soft-deleted centers and shops (schema version 4)
+are left out. Works with both SQLite and PostgreSQL connections.
+"""
+
+import argparse
+import time
+
+from dotenv import load_dotenv
+
+from db import STREAM_FETCH_SIZE, adapt_placeholders, connect_db, stream_rows
+from geo import CenterLocator
+
+load_dotenv()
+
+ASSIGNMENT_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS shop_nearest_center (
+        shop_id INTEGER PRIMARY KEY REFERENCES shops(id) ON DELETE CASCADE,
+        center_id INTEGER NOT NULL,
+        distance_km DOUBLE PRECISION NOT NULL,
+        shop_lat DOUBLE PRECISION NOT NULL,
+        shop_lon DOUBLE PRECISION NOT NULL,
+        computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_shop_nearest_center_center ON shop_nearest_center (center_id)",
+    # Centers the stored assignments were computed against
+    """
+    CREATE TABLE IF NOT EXISTS assigned_centers (
+        center_id INTEGER PRIMARY KEY,
+        lat DOUBLE PRECISION NOT NULL,
+        lon DOUBLE PRECISION NOT NULL
+    )
+    """,
+]
+
+
+def ensure_assignment_schema(conn):
+    """Create the assignment tables and index if they do not exist"""
+    cursor = conn.cursor()
+    for statement in ASSIGNMENT_SCHEMA:
+        cursor.execute(statement)
+    cursor.close()
+
+
+def assign_nearest_centers(conn, full=False, chunk_size=STREAM_FETCH_SIZE):
+    """Compute and store nearest centers for stale shops; returns the number of rows written.
+
+    The caller owns the transaction: commit (or roll back) the connection afterwards.
+    """
+    ensure_assignment_schema(conn)
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT * FROM shops LIMIT 0")
+    live = " WHERE {}deleted_at IS NULL" if "deleted_at" in {column[0] for column in cursor.description} else ""
+
+    cursor.execute(f"SELECT id, name, lat, lon FROM centers{live.format('')} ORDER BY id")
+    locator = CenterLocator(cursor.fetchall())
+    current = {cid: (lat, lon) for cid, _, lat, lon in locator.centers}
+
+    cursor.execute("SELECT center_id, lat, lon FROM assigned_centers")
+    previous = {cid: (float(lat), float(lon)) for cid, lat, lon in cursor.fetchall()}
+
+    removed = {cid for cid in previous if cid not in current}
+    changed = {cid for cid, coords in current.items() if previous.get(cid) != coords}  # added or moved
+    full = full or not previous
+
+    # Added/moved centers can beat an otherwise valid assignment
+    candidates = CenterLocator(c for c in locator.centers if c[0] in changed) if changed and not full else None
+    upsert = adapt_placeholders(conn, """
+        INSERT INTO shop_nearest_center (shop_id, center_id, distance_km, shop_lat, shop_lon, computed_at)
+        VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (shop_id) DO UPDATE SET
+            center_id = excluded.center_id,
+            distance_km = excluded.distance_km,
+            shop_lat = excluded.shop_lat,
+            shop_lon = excluded.shop_lon,
+            computed_at = excluded.computed_at
+    """)
+
+    # Shops are streamed in chunks, so memory stays flat however many shops there are
+    written = 0
+    for chunk in stream_rows(conn, f"""
+        SELECT s.id, s.lat, s.lon, a.center_id, a.distance_km, a.shop_lat, a.shop_lon
+        FROM shops s LEFT JOIN shop_nearest_center a ON a.shop_id = s.id{live.format('s.')}
+        ORDER BY s.id
+    """, fetch_size=chunk_size, chunks=True, call="assign_centers.shops"):
+        stale, settled = [], []
+        for shop_id, lat, lon, center_id, distance, shop_lat, shop_lon in chunk:
+            lat, lon = float(lat), float(lon)
+            if (full or center_id is None or (float(shop_lat), float(shop_lon)) != (lat, lon)
+                    or center_id in removed or center_id in changed):
+                stale.append((shop_id, lat, lon))
+            else:
+                settled.append((shop_id, lat, lon, center_id, float(distance)))
+
+        updates = []
+        if stale:
+            ids, dist = locator.nearest_many([s[1] for s in stale], [s[2] for s in stale])
+            updates.extend(
+                (shop_id, int(cid), float(d), lat, lon) for (shop_id, lat, lon), cid, d in zip(stale, ids, dist)
+            )
+        if settled and candidates is not None:
+            ids, dist = candidates.nearest_many([s[1] for s in settled], [s[2] for s in settled])
+            updates.extend(
+                (shop_id, int(cid), float(d), lat, lon)
+                for (shop_id, lat, lon, _, old_distance), cid, d in zip(settled, ids, dist)
+                if d < old_distance
+            )
+        cursor.executemany(upsert, updates)
+        written += len(updates)
+
+    if removed or changed:
+        cursor.execute("DELETE FROM assigned_centers")
+        cursor.executemany(
+            adapt_placeholders(conn, "INSERT INTO assigned_centers (center_id, lat, lon) VALUES (%s, %s, %s)"),
+            [(cid, lat, lon) for cid, (lat, lon) in current.items()]
+        )
+    cursor.close()
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store each shop's nearest Walmart center")
+    parser.add_argument("--sqlite", metavar="PATH", help="SQLite database file (default: PostgreSQL from .env)")
+    parser.add_argument("--full", action="store_true", help="Recompute every shop instead of only stale ones")
+    args = parser.parse_args()
+
+    print("🛣️ Walmart Risk Detection - Nearest Center Assignment")
+    print("=" * 55)
+
+    conn = connect_db(args.sqlite)
+    start = time.perf_counter()
+    try:
+        written = assign_nearest_centers(conn, full=args.full)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"✅ Updated {written} shop assignments in {time.perf_counter() - start:.2f}s")
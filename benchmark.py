@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for Walmart Risk Detection System
+Times the data and rendering hot paths against generated datasets of growing size:
+every db.py query, the in-memory filter step, nearest-center computation and the
+folium map build (with rendered HTML size).
+
+Datasets come from generate_data.py and are cached as SQLite files in --workdir
+(or loaded into the PostgreSQL database from .env with --backend postgresql,
+replacing its data). Results are written as JSON and can be compared against a
+previous run with --compare to catch regressions.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from itertools import product
+
+import numpy as np
+
+import db
+from assign_centers import assign_nearest_centers
+from generate_data import generate_centers, iter_shops, load_postgresql, load_sqlite
+from geo import CenterLocator, SpatialIndex, estimate_bounds, expand_bbox
+from map_layers import build_base_map, build_shop_layer, prepare_center_layer, prepare_shop_layer
+from migrate import migrate
+from shop_table import ShopTable
+
+# Viewport and marker limits as used by app.py
+MAP_WIDTH, MAP_HEIGHT = 1000, 600
+DEFAULT_ZOOM = 13
+VIEWPORT_MARGIN = 0.25
+MAX_MAP_SHOPS = 5000
+COVERAGE_RADIUS_KM = 2.0
+
+NEAREST_SAMPLE = 1000
+DELTA_ROWS = 100
+
+# Medians below this many milliseconds of change are treated as noise when comparing runs
+NOISE_FLOOR_MS = 1.0
+
+
+def _sqlite_dataset(workdir, centers, shops, seed):
+    path = os.path.join(workdir, f"bench_c{centers}_s{shops}_seed{seed}.db")
+    if not os.path.exists(path):
+        print(f"🧪 Generating {os.path.basename(path)}...")
+        center_rows = generate_centers(centers, seed)
+        conn = db.connect_db(path)
+        try:
+            load_sqlite(conn, center_rows, iter_shops(shops, center_rows, seed))
+            migrate(conn)
+            assign_nearest_centers(conn, full=True)
+            conn.commit()
+        finally:
+            conn.close()
+    return path
+
+
+def _postgresql_dataset(centers, shops, seed):
+    print(f"🧪 Loading {centers} centers / {shops} shops into PostgreSQL...")
+    center_rows = generate_centers(centers, seed)
+    conn = db.connect_db()
+    try:
+        load_postgresql(conn, center_rows, lambda: iter_shops(shops, center_rows, seed))
+        assign_nearest_centers(conn, full=True)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _use_backend(backend, sqlite_path=None):
+    """Point db.py at a dataset, dropping the pool of the previous one"""
+    os.environ["DB_BACKEND"] = backend
+    if sqlite_path:
+        os.environ["DB_SQLITE_PATH"] = sqlite_path
+    try:
+        db.get_pool().closeall()
+    except Exception:
+        pass
+    db.get_pool.clear()
+
+
+def _time(fn, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return result, times
+
+
+def _cases(centers, shops):
+    """(name, callable, size) benchmark cases for one dataset; size turns a result into (rows, bytes)"""
+    rows = lambda result: (len(result), None)  # noqa: E731
+    locator = CenterLocator(centers)
+    # Focus the busiest center, like an analyst looking at a dense area
+    center = centers[0]
+    if len(shops):
+        nearest_ids, _ = locator.nearest_many(shops.lats, shops.lons)
+        busiest = int(np.bincount(nearest_ids).argmax())
+        center = next(c for c in centers if c[0] == busiest)
+    view_bbox = expand_bbox(
+        estimate_bounds(center[2], center[3], DEFAULT_ZOOM, MAP_WIDTH, MAP_HEIGHT), VIEWPORT_MARGIN
+    )
+    shop_id = int(shops.ids[len(shops) // 2]) if len(shops) else 1
+    viewport_shops = shops.rows(shops.mask(["high", "medium", "low"], view_bbox))[:MAX_MAP_SHOPS]
+    center_layer = prepare_center_layer(centers, center[0])  # cached per focused center by app.py
+    sample = np.random.default_rng(0).integers(0, max(len(shops), 1), min(NEAREST_SAMPLE, len(shops)))
+    # A delta sync's worth of edited shops, spread over the table
+    delta_rows = [shops[int(pos)] for pos in np.linspace(0, len(shops) - 1, min(DELTA_ROWS, len(shops)), dtype=int)]
+
+    cases = [
+        ("db.get_all_centers", db.get_all_centers, rows),
+        ("db.get_shops", db.get_shops, rows),
+        ("db.query_shops", db.query_shops, rows),
+        ("db.stream_shops", lambda: sum(len(chunk) for chunk in db.stream_shops(chunks=True)), lambda count: (count, None)),
+        ("db.query_shops[risk=high]", lambda: db.query_shops(["high"]), rows),
+        ("db.query_shops[viewport]", lambda: db.query_shops(None, view_bbox, MAX_MAP_SHOPS), rows),
+        ("db.query_shops[viewport,geohash]", lambda: db.query_shops(None, view_bbox, MAX_MAP_SHOPS, geohash=True), rows),
+        ("db.query_shops_within_radius",
+         lambda: db.query_shops_within_radius(center[2], center[3], COVERAGE_RADIUS_KM), rows),
+        ("db.get_shop_by_id", lambda: db.get_shop_by_id(shop_id), lambda result: (1, None)),
+        ("db.get_shop_assignment", lambda: db.get_shop_assignment(shop_id), lambda result: (1, None)),
+        ("db.get_risk_counts", db.get_risk_counts, lambda result: (sum(result.values()), None)),
+        ("db.get_risk_counts[center]", lambda: db.get_risk_counts(center_id=center[0]),
+         lambda result: (sum(result.values()), None)),
+        ("db.get_center_risk_counts", db.get_center_risk_counts, rows),
+        ("db.get_page_data", db.get_page_data, lambda page: (len(page.centers) + len(page.shops), None)),
+        ("db.get_changes[idle]", lambda: db.get_changes(db.get_sync_watermark()),
+         lambda changes: (len(changes.shops) if changes else 0, None)),
+        ("filter.shop_table_build", lambda: ShopTable.from_rows(db.query_shops()), rows),
+        ("filter.mask_rows[viewport,high+medium]", lambda: shops.rows(shops.mask(["high", "medium"], view_bbox)), rows),
+        ("filter.spatial_index_build", lambda: SpatialIndex(shops), rows),
+        (f"filter.shop_table_merge[{DELTA_ROWS}]", lambda: shops.merge(delta_rows), rows),
+        ("nearest.locator_build", lambda: CenterLocator(centers), rows),
+        (f"nearest.loop[{NEAREST_SAMPLE}]",
+         lambda: [locator.nearest(shops.lats[i], shops.lons[i]) for i in sample], rows),
+        ("nearest.nearest_many[all]", lambda: locator.nearest_many(shops.lats, shops.lons)[0], rows),
+        ("map.prepare_centers", lambda: prepare_center_layer(centers, center[0]),
+         lambda layer: (len(centers), len(layer.encode()))),
+        ("map.base_map", lambda: build_base_map(center, "OpenStreetMap", DEFAULT_ZOOM, center_layer, COVERAGE_RADIUS_KM),
+         lambda result: (len(centers), None)),
+    ]
+    for mode in ("GeoJSON", "Clustered", "Individual"):
+        cases.append((f"map.prepare[{mode}]", lambda mode=mode: prepare_shop_layer(mode, viewport_shops),
+                      lambda result: (len(viewport_shops), None)))
+        cases.append((f"map.render[{mode}]", lambda mode=mode: _render(mode, center, center_layer, viewport_shops),
+                      lambda html: (len(viewport_shops), len(html.encode()))))
+    return cases
+
+
+def _render(mode, center, center_layer, shops):
+    m = build_base_map(center, "OpenStreetMap", DEFAULT_ZOOM, center_layer, COVERAGE_RADIUS_KM)
+    build_shop_layer(mode, prepare_shop_layer(mode, shops)).add_to(m)
+    return m.get_root().render()
+
+
+def run_dataset(backend, centers, shops, seed, repeat, workdir):
+    """Benchmark results (one dict per case) for a dataset of the given size"""
+    if backend == "sqlite":
+        _use_backend("sqlite", _sqlite_dataset(workdir, centers, shops, seed))
+    else:
+        _postgresql_dataset(centers, shops, seed)
+        _use_backend("postgresql")
+
+    center_rows = [(cid, name, float(lat), float(lon)) for cid, name, lat, lon in db.get_all_centers()]
+    shop_table = ShopTable.from_rows(db.query_shops())
+    results = []
+    for name, fn, size in _cases(center_rows, shop_table):
+        result, times = _time(fn, repeat)
+        count, nbytes = size(result)
+        results.append({
+            "case": name,
+            "centers": centers,
+            "shops": shops,
+            "repeat": repeat,
+            "min_ms": round(min(times), 4),
+            "median_ms": round(statistics.median(times), 4),
+            "mean_ms": round(statistics.fmean(times), 4),
+            "rows": count,
+            "bytes": nbytes,
+        })
+        print(f"   {name:<42} {results[-1]['median_ms']:>10.2f} ms  rows={count}"
+              + (f"  html={nbytes / 1024:.0f} KiB" if nbytes else ""))
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, threshold):
+    """Cases whose median got slower than the baseline by more than threshold (a fraction) as dicts"""
+    previous = {(r["case"], r["centers"], r["shops"]): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = previous.get((result["case"], result["centers"], result["shops"]))
+        if before is None or before["median_ms"] <= 0:
+            continue
+        change = result["median_ms"] / before["median_ms"] - 1
+        if change > threshold and result["median_ms"] - before["median_ms"] > NOISE_FLOOR_MS:
+            regressions.append({**result, "baseline_median_ms": before["median_ms"], "change": round(change, 4)})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark queries, filtering, nearest centers and map rendering")
+    parser.add_argument("--shops", type=int, nargs="+", default=[100, 10_000, 100_000, 1_000_000],
+                        help="Shop counts to benchmark (default: 100 10000 100000 1000000)")
+    parser.add_argument("--centers", type=int, nargs="+", default=[50, 5000],
+                        help="Center counts to benchmark (default: 50 5000)")
+    parser.add_argument("--seed", type=int, default=42, help="Data generator seed")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case (median is compared)")
+    parser.add_argument("--backend", choices=["sqlite", "postgresql"], default="sqlite",
+                        help="sqlite: cached files in --workdir; postgresql: REPLACES the data of the .env database")
+    parser.add_argument("--workdir", default="benchmarks", help="Directory for generated SQLite datasets")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON results file")
+    parser.add_argument("--compare", metavar="BASELINE", help="Previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed median slowdown before failing (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    # db.py reports errors through Streamlit, which only logs them outside a running app
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    print("⏱️ Walmart Risk Detection - Benchmarks")
+    print("=" * 55)
+    os.makedirs(args.workdir, exist_ok=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": args.backend,
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": [],
+    }
+    for centers, shops in product(sorted(args.centers), sorted(args.shops)):
+        print(f"\n📋 {centers} centers, {shops} shops ({args.backend})")
+        report["results"].extend(run_dataset(args.backend, centers, shops, args.seed, args.repeat, args.workdir))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for r in regressions:
+            print(f"❌ {r['case']} ({r['centers']} centers, {r['shops']} shops): "
+                  f"{r['baseline_median_ms']:.2f} -> {r['median_ms']:.2f} ms (+{r['change']:.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No regressions above {args.threshold:.0%} against {args.compare}")
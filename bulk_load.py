@@ -0,0 +1,108 @@
+"""
+Bulk PostgreSQL loader for the Walmart Risk Detection System
+
+Streams rows into temporary staging tables with COPY FROM STDIN (falling back to
+batched multi-row INSERT ... VALUES when COPY is not available), then replaces the
+live tables' contents with DELETE + INSERT ... SELECT in a single transaction.
+DELETE only takes row locks, so readers are never blocked and keep seeing the old
+rows (MVCC) until the caller commits; the app never observes empty or half-loaded
+tables, and triggers, indexes and foreign keys on the live tables are left in
+place. The deleted row versions are reclaimed by autovacuum afterwards.
+"""
+
+import csv
+import io
+import time
+from itertools import islice
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+COPY_CHUNK_ROWS = 50_000
+VALUES_PAGE_SIZE = 1_000
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def copy_rows(cursor, table, columns, rows, chunk_size=COPY_CHUNK_ROWS):
+    """Stream rows into a table with COPY FROM STDIN, one CSV chunk at a time; returns the row count"""
+    count = 0
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    for chunk in _chunks(rows, chunk_size):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(chunk)
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+        count += len(chunk)
+    return count
+
+
+def insert_rows(cursor, table, columns, rows, page_size=VALUES_PAGE_SIZE):
+    """Insert rows with multi-row INSERT ... VALUES statements; returns the row count"""
+    count = 0
+    statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s"
+    for chunk in _chunks(rows, page_size):
+        execute_values(cursor, statement, chunk, page_size=page_size)
+        count += len(chunk)
+    return count
+
+
+def _load(conn, tables, loader):
+    stats = []
+    cursor = conn.cursor()
+    try:
+        for table, columns, rows in tables:
+            staging = f"{table}_staging"
+            # Only the loaded columns: LIKE would copy NOT NULL but not the defaults of the others
+            # (e.g. version/updated_at from migrate.py), so staging rows without them would be rejected
+            cursor.execute(
+                f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS SELECT {', '.join(columns)} FROM {table} WITH NO DATA"
+            )
+            start = time.perf_counter()
+            count = loader(cursor, staging, columns, rows() if callable(rows) else rows)
+            stats.append((table, count, time.perf_counter() - start))
+
+        # Swap the staged rows in. Not TRUNCATE: its ACCESS EXCLUSIVE lock would block every
+        # reader until the caller commits (after e.g. a long nearest-center assignment)
+        for table, _, _ in reversed(tables):  # dependent tables first; ON DELETE CASCADE does the rest
+            cursor.execute(f"DELETE FROM {table}")
+        for table, columns, _ in tables:
+            column_list = ", ".join(columns)
+            cursor.execute(f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {table}_staging")
+    finally:
+        cursor.close()
+    return stats
+
+
+def replace_tables(conn, tables, method="auto"):
+    """Replace the contents of tables with new rows via staging tables.
+
+    ``tables`` is a list of (table, columns, rows) in dependency order (referenced
+    tables first); ``rows`` may be a callable returning a fresh iterable, which
+    lets the "auto" method retry with INSERT ... VALUES if COPY fails. Returns
+    (method used, [(table, rows loaded, seconds), ...]). The caller owns the
+    transaction: commit to publish the new rows (and commit earlier work first,
+    since falling back from COPY rolls the transaction back).
+    """
+    if method in ("auto", "copy"):
+        try:
+            return "copy", _load(conn, tables, copy_rows)
+        except psycopg2.Error:
+            if method == "copy" or not all(callable(rows) for _, _, rows in tables):
+                raise
+            conn.rollback()
+    return "values", _load(conn, tables, insert_rows)
+
+
+def report(method, stats):
+    """Print rows and rows/second per loaded table"""
+    for table, count, seconds in stats:
+        rate = count / seconds if seconds > 0 else float("inf")
+        print(f"   - {table}: {count} rows in {seconds:.2f}s ({rate:,.0f} rows/s via {method.upper()})")
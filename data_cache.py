@@ -0,0 +1,402 @@
+"""
+Process-wide data cache for the Walmart Risk Detection app
+
+Holds one immutable snapshot of the centers and shops tables that is shared by
+every Streamlit session. Snapshots expire after DATA_CACHE_TTL seconds, can be
+dropped explicitly with invalidate_cache(), and (on PostgreSQL) are dropped
+early whenever the database sends a NOTIFY on the change channel (see the
+triggers created by setup_neon.py / postgresql_setup.sql).
+
+On databases with row versions (schema version 4, see migrate.py) the snapshot
+is kept fresh in between: every DELTA_SYNC_INTERVAL seconds, or as soon as an
+INSERT/UPDATE notification arrives, only the rows changed since the snapshot's
+watermark (see db.get_sync_watermark) are fetched and merged into a new snapshot.
+"""
+
+import heapq
+import select
+import threading
+import time
+from collections import namedtuple
+from itertools import islice
+from types import MappingProxyType
+
+import psycopg2
+import streamlit as st
+
+from db import (
+    get_setting, get_backend, get_changes, get_connection_params, get_page_data, get_query_executor,
+    get_shop_by_id, get_shop_assignment, get_risk_counts, get_sync_watermark, has_row_versions, in_worker,
+    query_shops,
+)
+from geo import CenterLocator, GridIndex, SpatialIndex, bbox_tiles
+from metrics import timed
+from shop_table import EMPTY_SHOP_TABLE, ShopTable
+
+CHANGE_CHANNEL = "walmart_data_changed"
+CACHE_TTL = int(get_setting("DATA_CACHE_TTL", 300))
+DELTA_SYNC_INTERVAL = float(get_setting("DELTA_SYNC_INTERVAL", 5))
+
+# Notified operations that a delta sync can pick up; anything else (DELETE, TRUNCATE) reloads
+DELTA_SYNC_OPERATIONS = {"INSERT", "UPDATE"}
+
+DataSnapshot = namedtuple(
+    "DataSnapshot",
+    [
+        "centers", "centers_by_id", "center_locator", "shops", "shop_index", "shop_grid",
+        "risk_counts", "center_risk_counts", "loaded_at", "watermark",
+    ],
+)
+
+EMPTY_COUNTS = MappingProxyType({})
+
+EMPTY_SNAPSHOT = DataSnapshot(
+    (), MappingProxyType({}), CenterLocator(()), EMPTY_SHOP_TABLE,
+    SpatialIndex(EMPTY_SHOP_TABLE), GridIndex(EMPTY_SHOP_TABLE), EMPTY_COUNTS, EMPTY_COUNTS, 0.0, None
+)
+
+# Set by the change listener to make the next read delta-sync without waiting for the interval
+_sync_requested = threading.Event()
+
+
+class SnapshotUnavailable(Exception):
+    """Raised by the loader so that a failed fetch is never cached"""
+
+
+def _adjusted_risk_counts(snapshot, changes):
+    """Total and per-center risk counts with the changed shops' snapshot rows taken out and new rows put in.
+
+    Shops count towards their stored nearest center as of this sync; counts that drift when
+    assign_centers.py moves shops between centers are corrected by the next full reload.
+    """
+    totals = dict(snapshot.risk_counts)
+    centers = {}
+
+    def add(shop_id, risk, step):
+        risk = risk.lower() if risk else risk
+        totals[risk] = totals.get(risk, 0) + step
+        center_id = changes.shop_centers.get(shop_id)
+        if center_id is not None:
+            if center_id not in centers:
+                centers[center_id] = dict(snapshot.center_risk_counts.get(center_id, EMPTY_COUNTS))
+            centers[center_id][risk] = centers[center_id].get(risk, 0) + step
+
+    for shop_id in changes.shop_centers:
+        old = snapshot.shops.get(shop_id)
+        if old is not None:
+            add(shop_id, old[4], -1)
+    for shop in changes.shops:
+        add(shop[0], shop[4], 1)
+
+    def positive(counts):
+        return MappingProxyType({risk: n for risk, n in counts.items() if n > 0})
+
+    center_risk_counts = dict(snapshot.center_risk_counts)
+    center_risk_counts.update((center_id, positive(counts)) for center_id, counts in centers.items())
+    return positive(totals), MappingProxyType(center_risk_counts)
+
+
+def apply_changes(snapshot, changes):
+    """New snapshot with the centers and shops of a db.Changes merged in (indexes rebuilt as needed)"""
+    centers, centers_by_id, center_locator = snapshot.centers, snapshot.centers_by_id, snapshot.center_locator
+    if changes.centers or changes.deleted_centers:
+        by_id = dict(centers_by_id)
+        for center_id in changes.deleted_centers:
+            by_id.pop(center_id, None)
+        by_id.update((center[0], center) for center in changes.centers)
+        centers = tuple(sorted(by_id.values(), key=lambda center: center[0]))
+        centers_by_id, center_locator = MappingProxyType(by_id), CenterLocator(centers)
+
+    shops, shop_index, shop_grid = snapshot.shops, snapshot.shop_index, snapshot.shop_grid
+    risk_counts, center_risk_counts = snapshot.risk_counts, snapshot.center_risk_counts
+    if changes.shops or changes.deleted_shops:
+        shops = shops.merge(changes.shops, changes.deleted_shops)
+        shop_index, shop_grid = SpatialIndex(shops), GridIndex(shops)
+        risk_counts, center_risk_counts = _adjusted_risk_counts(snapshot, changes)
+
+    return DataSnapshot(
+        centers, centers_by_id, center_locator, shops, shop_index, shop_grid,
+        risk_counts, center_risk_counts, time.time(), changes.watermark
+    )
+
+
+class SnapshotStore:
+    """The current shared snapshot, delta-synced with the database while it is cached"""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.synced_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def maybe_sync(self):
+        """Current snapshot, after merging changed rows first if a sync is due and not already running"""
+        if self.snapshot.watermark is None:
+            return self.snapshot  # no row versions: only the TTL and notifications refresh the data
+        due = _sync_requested.is_set() or (
+            DELTA_SYNC_INTERVAL > 0 and time.monotonic() - self.synced_at >= DELTA_SYNC_INTERVAL
+        )
+        if due and self._lock.acquire(blocking=False):  # other sessions keep reading the current snapshot
+            try:
+                _sync_requested.clear()
+                self.sync()
+            finally:
+                self._lock.release()
+        return self.snapshot
+
+    @timed("data_cache.sync")
+    def sync(self):
+        """Fetch the rows changed since the snapshot's watermark and swap in the merged snapshot"""
+        snapshot = self.snapshot
+        changes = get_changes(snapshot.watermark)
+        self.synced_at = time.monotonic()
+        if changes is None:
+            return
+        if not (changes.centers or changes.shops or changes.deleted_centers or changes.deleted_shops):
+            if changes.watermark != snapshot.watermark:
+                self.snapshot = snapshot._replace(watermark=changes.watermark)
+            return
+        self.snapshot = apply_changes(snapshot, changes)
+        _clear_filtered_caches()
+
+
+@st.cache_resource(ttl=CACHE_TTL, show_spinner=False)
+@timed("data_cache.load_snapshot")
+def _load_snapshot():
+    has_row_versions.clear()  # notice a migration to row versions on the next full load
+    # Read before the rows, so changes committed while loading are merged by the next sync
+    watermark = get_sync_watermark()
+    # Centers, shops and risk aggregates arrive together, for the latency of one round trip
+    page = get_page_data()
+    centers = tuple(page.centers)
+    if not centers:
+        raise SnapshotUnavailable("No centers returned from the database")
+    shops = ShopTable.from_rows(page.shops)
+    centers_by_id = MappingProxyType({center[0]: center for center in centers})
+    center_risk_counts = MappingProxyType(
+        {center_id: MappingProxyType(counts) for center_id, counts in page.center_risk_counts.items()}
+    )
+    return SnapshotStore(DataSnapshot(
+        centers, centers_by_id, CenterLocator(centers),
+        shops, SpatialIndex(shops), GridIndex(shops),
+        MappingProxyType(page.risk_counts), center_risk_counts, time.time(), watermark
+    ))
+
+
+def get_snapshot():
+    """Current shared snapshot of centers and shops (treat as read-only)"""
+    try:
+        store = _load_snapshot()
+        if store.snapshot.watermark is None and _sync_requested.is_set():
+            _sync_requested.clear()  # nothing to delta-sync from, so a notified change reloads everything
+            invalidate_cache()
+            store = _load_snapshot()
+        return store.maybe_sync()
+    except SnapshotUnavailable:
+        return EMPTY_SNAPSHOT
+
+
+# Entries hold up to a full map's worth of rows, so fewer of them are kept than for single shops
+@st.cache_resource(ttl=CACHE_TTL, max_entries=256, show_spinner=False)
+def _load_filtered_shops(risk_levels, bbox, limit):
+    return tuple(query_shops(risk_levels, bbox, limit))
+
+
+@st.cache_resource(ttl=CACHE_TTL, max_entries=1000, show_spinner=False)
+def _load_shop_analysis(shop_id):
+    shop = get_shop_by_id(shop_id)
+    if shop is None:
+        raise SnapshotUnavailable(f"Shop {shop_id} not found")
+    return shop[5]
+
+
+@st.cache_resource(ttl=CACHE_TTL, max_entries=1000, show_spinner=False)
+def _load_shop_assignment(shop_id):
+    return get_shop_assignment(shop_id)
+
+
+@st.cache_resource(ttl=CACHE_TTL, max_entries=1000, show_spinner=False)
+def _load_risk_counts(center_id, bbox):
+    return MappingProxyType(get_risk_counts(center_id, bbox))
+
+
+def _clear_filtered_caches():
+    _load_filtered_shops.clear()
+    _load_shop_analysis.clear()
+    _load_shop_assignment.clear()
+    _load_risk_counts.clear()
+
+
+def invalidate_cache():
+    """Drop the shared snapshot and filtered results so the next read reloads them from the database"""
+    _load_snapshot.clear()
+    _clear_filtered_caches()
+
+
+def request_sync():
+    """Make the next read delta-sync the snapshot (falls back to a full reload without row versions)"""
+    _sync_requested.set()
+
+
+def get_cached_center(center_id):
+    """Get Walmart center information by ID from the shared snapshot"""
+    try:
+        return get_snapshot().centers_by_id.get(int(center_id))
+    except (TypeError, ValueError):
+        return None
+
+
+def get_cached_centers():
+    """Get all Walmart centers from the shared snapshot"""
+    return get_snapshot().centers
+
+
+def get_nearest_center(shop_id, lat, lon):
+    """Nearest center row (float coordinates) and distance in km for a shop.
+
+    Reads the assignment precomputed by assign_centers.py and only falls back to
+    the in-memory locator when the shop has no stored assignment, or a stale one: the
+    shop or its center has moved (or the center is gone) since it was computed.
+    """
+    snapshot = get_snapshot()
+    lat, lon = float(lat), float(lon)
+    assignment = _load_shop_assignment(shop_id)
+    if assignment is not None:
+        center_id, distance_km, shop_lat, shop_lon, center_lat, center_lon = assignment
+        center = snapshot.centers_by_id.get(center_id)
+        fresh = (
+            center is not None and center_lat is not None
+            and (float(shop_lat), float(shop_lon)) == (lat, lon)
+            and (float(center_lat), float(center_lon)) == (float(center[2]), float(center[3]))
+        )
+        if fresh:
+            return (center[0], center[1], float(center[2]), float(center[3])), float(distance_km)
+    return snapshot.center_locator.nearest(lat, lon)
+
+
+def get_shop_index():
+    """Spatial index over the shops in the shared snapshot (k-nearest / radius queries)"""
+    return get_snapshot().shop_index
+
+
+def get_cached_shop(shop_id):
+    """Get one shop (slim listing row) by ID from the shared snapshot"""
+    try:
+        return get_snapshot().shops.get(int(shop_id))
+    except (TypeError, ValueError):
+        return None
+
+
+def find_shop_at(lat, lon, tolerance_deg=0.001):
+    """Shop at a clicked map position (spatial hash lookup), or None"""
+    return get_snapshot().shop_grid.at(lat, lon, tolerance_deg)
+
+
+def get_cached_filtered_shops(risk_levels=None, bbox=None, limit=None):
+    """Get shops filtered in SQL by risk levels / bounding box, shared per distinct filter"""
+    if risk_levels is not None:
+        risk_levels = frozenset(level.lower() for level in risk_levels)
+    return _load_filtered_shops(risk_levels, tuple(bbox) if bbox else None, limit)
+
+
+def get_viewport_shops(risk_levels, bbox, zoom, limit=None, max_tiles=16):
+    """Get shops inside a map viewport, fetched and cached per grid tile.
+
+    The bounding box is split into the fixed tiles from geo.bbox_tiles, each loaded
+    with its own bbox query and cache entry, so panning back over tiles that were
+    already seen costs no database round trip. Tiles are loaded concurrently on the
+    query executor, so a cold view waits for one round trip instead of one per tile.
+    Each tile holds its first ``limit`` shops by id, so merging them by id and keeping
+    the first ``limit`` gives the same rows as one limited query over all tiles.
+    """
+    tiles = bbox_tiles(bbox, zoom, max_tiles)
+    if len(tiles) > 1:
+        load = in_worker(get_cached_filtered_shops)
+        futures = [get_query_executor().submit(load, risk_levels, tile, limit) for tile in tiles]
+        tile_shops = [future.result() for future in futures]
+    else:
+        tile_shops = [get_cached_filtered_shops(risk_levels, bbox=tile, limit=limit) for tile in tiles]
+    shops = _unique_shops(heapq.merge(*tile_shops, key=lambda shop: shop[0]))
+    return list(islice(shops, limit))
+
+
+def _unique_shops(shops):
+    """Id-ordered shop rows with repeats dropped (BETWEEN is inclusive, so tile edges can overlap)"""
+    last_id = None
+    for shop in shops:
+        if shop[0] != last_id:
+            last_id = shop[0]
+            yield shop
+
+
+def get_cached_risk_counts(center_id=None, bbox=None):
+    """Shops per risk level counted in SQL, shared per center / bounding box until the data changes.
+
+    Totals and per-center counts come with the snapshot; bounding boxes are counted on demand.
+    """
+    if not bbox:
+        snapshot = get_snapshot()
+        if center_id is None:
+            return snapshot.risk_counts
+        return snapshot.center_risk_counts.get(int(center_id), EMPTY_COUNTS)
+    return _load_risk_counts(int(center_id) if center_id is not None else None, tuple(bbox))
+
+
+def get_cached_shop_analysis(shop_id):
+    """Full analysis text for one shop, fetched on demand and cached per shop"""
+    try:
+        return _load_shop_analysis(shop_id)
+    except SnapshotUnavailable:
+        return ""
+
+
+def _delta_syncable(payloads):
+    """Whether notifications ("table:OPERATION" payloads) only report changes a delta sync picks up"""
+    return all(payload.partition(":")[2] in DELTA_SYNC_OPERATIONS for payload in payloads)
+
+
+def _listen_for_changes(stop_event, poll_interval=5.0, max_backoff=60.0):
+    """Sync or invalidate the cache whenever a NOTIFY arrives on CHANGE_CHANNEL, reconnecting on failure"""
+    backoff = 1.0
+    while not stop_event.is_set():
+        conn = None
+        try:
+            conn = psycopg2.connect(**get_connection_params())
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANGE_CHANNEL}")
+            # Changes may have happened while we were not listening
+            invalidate_cache()
+            backoff = 1.0
+            while not stop_event.is_set():
+                if select.select([conn], [], [], poll_interval) == ([], [], []):
+                    continue
+                conn.poll()
+                if conn.notifies:
+                    payloads = [notify.payload for notify in conn.notifies]
+                    conn.notifies.clear()
+                    if _delta_syncable(payloads):
+                        request_sync()
+                    else:
+                        invalidate_cache()
+        except (psycopg2.Error, OSError):
+            stop_event.wait(backoff)
+            backoff = min(backoff * 2, max_backoff)
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+@st.cache_resource(show_spinner=False)
+def start_change_listener():
+    """Start the background LISTEN thread once per process; returns its stop event"""
+    stop_event = threading.Event()
+    if get_backend() == "sqlite":
+        return stop_event  # SQLite has no NOTIFY; snapshots expire after CACHE_TTL
+    thread = threading.Thread(
+        target=_listen_for_changes,
+        args=(stop_event,),
+        name="data-cache-listener",
+        daemon=True,
+    )
+    thread.start()
+    return stop_event
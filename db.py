@@ -1,113 +1,702 @@
 import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+
 import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
 from dotenv import load_dotenv
+import numpy as np
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from geo import geohash_prefixes, haversine_km, radius_bbox
+from metrics import bind, estimate_bytes, record_query, span, timed
 
 load_dotenv()
 
-def get_db_connection():
-    """Get PostgreSQL database connection - handles both local .env and Streamlit Cloud secrets"""
+
+# Characters of analysis text shipped with shop listings (map popups)
+ANALYSIS_PREVIEW_LENGTH = 100
+
+SHOP_LISTING_COLUMNS = (
+    "id, name, lat, lon, risk, "
+    f"CASE WHEN length(analysis) > {ANALYSIS_PREVIEW_LENGTH} "
+    f"THEN substr(analysis, 1, {ANALYSIS_PREVIEW_LENGTH}) || '...' ELSE analysis END AS analysis_preview"
+)
+
+
+# Most geohash prefixes (index range scans) a bounding-box query is split into
+GEOHASH_MAX_PREFIXES = 16
+
+# Rows fetched per round trip by streaming (server-side cursor) queries
+STREAM_FETCH_SIZE = 2000
+
+PageData = namedtuple("PageData", ["center", "centers", "shops", "risk_counts", "center_risk_counts"])
+
+# Rows changed since a sync watermark (delta sync); deleted_* are ids of soft-deleted rows and
+# shop_centers maps every changed shop id to its stored nearest center id (or None)
+Changes = namedtuple("Changes", ["centers", "shops", "deleted_centers", "deleted_shops", "shop_centers", "watermark"])
+
+# Read-only SQLite tuning: memory-mapped reads and a per-connection page cache
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+SQLITE_CACHE_KIB = 64 * 1024
+
+
+class DatabaseConnectionError(Exception):
+    """Raised when no database connection could be obtained (already reported to the user)"""
+
+
+def get_setting(name, default=None):
+    """Read a database setting from Streamlit secrets, falling back to environment variables"""
     try:
         # Try Streamlit secrets first (for cloud deployment)
-        if hasattr(st, 'secrets') and 'database' in st.secrets:
-            conn = psycopg2.connect(
-                host=st.secrets["database"]["DB_HOST"],
-                port=st.secrets["database"]["DB_PORT"],
-                dbname=st.secrets["database"]["DB_NAME"],
-                user=st.secrets["database"]["DB_USER"],
-                password=st.secrets["database"]["DB_PASS"]
-            )
-        else:
-            # Fallback to environment variables (for local development)
-            conn = psycopg2.connect(
-                host=os.getenv("DB_HOST"),
-                port=os.getenv("DB_PORT"),
-                dbname=os.getenv("DB_NAME"),
-                user=os.getenv("DB_USER"),
-                password=os.getenv("DB_PASS")
-            )
+        if hasattr(st, 'secrets') and 'database' in st.secrets and name in st.secrets["database"]:
+            return st.secrets["database"][name]
+    except FileNotFoundError:
+        pass  # No secrets.toml - local development
+    return os.getenv(name, default)
+
+
+def get_connection_params():
+    """Connection keyword arguments for psycopg2 - handles both local .env and Streamlit Cloud secrets"""
+    return {
+        "host": get_setting("DB_HOST"),
+        "port": get_setting("DB_PORT"),
+        "dbname": get_setting("DB_NAME"),
+        "user": get_setting("DB_USER"),
+        "password": get_setting("DB_PASS"),
+    }
+
+
+def get_backend():
+    """Configured database backend: 'postgresql' (default) or 'sqlite'"""
+    return str(get_setting("DB_BACKEND", "postgresql")).lower()
+
+
+def get_sqlite_path():
+    """Path of the SQLite database file used by the sqlite backend"""
+    return get_setting("DB_SQLITE_PATH", "walmart_risk.db")
+
+
+def connect_db(sqlite_path=None):
+    """Dedicated read-write connection for command-line scripts: a SQLite file, or PostgreSQL from .env"""
+    if sqlite_path:
+        return sqlite3.connect(sqlite_path)
+    return psycopg2.connect(**get_connection_params(), sslmode=get_setting("DB_SSLMODE", "prefer"))
+
+
+def is_sqlite(conn):
+    """Whether a connection is a SQLite one (rather than psycopg2)"""
+    return isinstance(conn, sqlite3.Connection)
+
+
+def adapt_placeholders(conn, query):
+    """Adapt %s placeholders to the connection's driver"""
+    return query.replace("%s", "?") if is_sqlite(conn) else query
+
+
+class ConnectionPool:
+    """Thread-safe pool of PostgreSQL connections shared by every Streamlit session.
+
+    Up to ``maxconn`` connections are kept open and reused. Callers block for up to
+    ``timeout`` seconds when all of them are checked out. Connections that have been
+    idle longer than ``ping_after`` seconds are pinged before being handed out, and
+    dead ones are transparently replaced with a fresh connection.
+    """
+
+    def __init__(self, connect_params, minconn=1, maxconn=10, timeout=10.0, ping_after=30.0):
+        self.minconn = int(minconn)
+        self.maxconn = max(int(maxconn), self.minconn, 1)
+        self.timeout = float(timeout)
+        self.ping_after = float(ping_after)
+        self._connect_params = connect_params
+        self._idle = []  # (connection, last used) pairs, most recently used last
+        self._size = 0  # open connections, idle and checked out
+        self._cond = threading.Condition()
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "connections_created": 0,
+            "connections_replaced": 0,
+        }
+        for _ in range(self.minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        conn = psycopg2.connect(**self._connect_params)
+        # Reads are single statements; autocommit avoids an extra BEGIN round trip per query
+        conn.autocommit = True
+        with self._cond:
+            self._stats["connections_created"] += 1
         return conn
+
+    def _is_healthy(self, conn, last_used):
+        if conn.closed or conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if time.monotonic() - last_used < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        """Check out a healthy connection, waiting for a free slot if the pool is full"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._cond:
+            while not self._idle and self._size >= self.maxconn:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolError(f"Timed out after {self.timeout:.1f}s waiting for a database connection")
+                self._cond.wait(remaining)
+            if self._idle:
+                conn, last_used = self._idle.pop()
+            else:
+                conn, last_used = None, None
+                self._size += 1
+            waited = time.monotonic() - start
+            self._stats["checkouts"] += 1
+            self._stats["wait_time_total"] += waited
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+            if waited > 0.001:
+                self._stats["waits"] += 1
+
+        # Health checks and connects happen outside the lock so slow networks don't serialize checkouts
+        if conn is not None and not self._is_healthy(conn, last_used):
+            self._close_quietly(conn)
+            with self._cond:
+                self._stats["connections_replaced"] += 1
+            conn = None
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+        return conn
+
+    def putconn(self, conn, broken=False):
+        """Return a connection to the pool, closing it instead if it is broken"""
+        if not broken and not conn.closed and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        with self._cond:
+            if broken or conn.closed:
+                self._close_quietly(conn)
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        """Close every idle connection and forget about checked-out ones"""
+        with self._cond:
+            for conn, _ in self._idle:
+                self._close_quietly(conn)
+            self._size -= len(self._idle)
+            self._idle = []
+
+    def stats(self):
+        """Snapshot of pool usage and wait metrics"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["size"] = self._size
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._size - len(self._idle)
+            stats["max_size"] = self.maxconn
+        stats["wait_time_avg"] = stats["wait_time_total"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        return stats
+
+
+class SQLitePool(ConnectionPool):
+    """Pool of read-only SQLite connections to a local database file.
+
+    Connections are opened in read-only mode with memory-mapped I/O, a large page
+    cache and ``query_only`` set, and are shared by every session like the
+    PostgreSQL pool (same checkout limits, waits and stats).
+    """
+
+    def __init__(self, path, mmap_size=SQLITE_MMAP_SIZE, cache_kib=SQLITE_CACHE_KIB, **kwargs):
+        self.path = os.path.abspath(path)
+        self.mmap_size = int(mmap_size)
+        self.cache_kib = int(cache_kib)
+        super().__init__(None, **kwargs)
+
+    def _connect(self):
+        if not os.path.exists(self.path):
+            raise sqlite3.OperationalError(f"SQLite database not found: {self.path}")
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        conn.execute(f"PRAGMA mmap_size = {self.mmap_size}")
+        conn.execute(f"PRAGMA cache_size = -{self.cache_kib}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA query_only = ON")
+        with self._cond:
+            self._stats["connections_created"] += 1
+        return conn
+
+    def _is_healthy(self, conn, last_used):
+        return True  # local files don't drop connections
+
+    def putconn(self, conn, broken=False):
+        """Return a connection to the pool, closing it instead if it is broken"""
+        if not broken and conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            if broken:
+                self._close_quietly(conn)
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+
+@st.cache_resource(show_spinner=False)
+def get_pool():
+    """Process-wide connection pool, created on first use and shared across all sessions"""
+    if get_backend() == "sqlite":
+        return SQLitePool(
+            get_sqlite_path(),
+            mmap_size=get_setting("DB_SQLITE_MMAP_SIZE", SQLITE_MMAP_SIZE),
+            cache_kib=get_setting("DB_SQLITE_CACHE_KIB", SQLITE_CACHE_KIB),
+            minconn=get_setting("DB_POOL_MIN", 1),
+            maxconn=get_setting("DB_POOL_MAX", 10),
+            timeout=get_setting("DB_POOL_TIMEOUT", 10),
+        )
+    return ConnectionPool(
+        get_connection_params(),
+        minconn=get_setting("DB_POOL_MIN", 1),
+        maxconn=get_setting("DB_POOL_MAX", 10),
+        timeout=get_setting("DB_POOL_TIMEOUT", 10),
+        ping_after=get_setting("DB_POOL_PING_AFTER", 30),
+    )
+
+
+def get_pool_stats():
+    """Usage and wait metrics of the shared connection pool"""
+    return get_pool().stats()
+
+
+@contextmanager
+def get_connection():
+    """Borrow a pooled connection for the duration of a ``with`` block"""
+    try:
+        with span("db.get_connection"):
+            pool = get_pool()
+            conn = pool.getconn()
     except Exception as e:
         st.error(f"Database connection failed: {str(e)}")
         st.error("Please check your database credentials in Streamlit Cloud secrets or local .env file")
-        return None
+        raise DatabaseConnectionError(str(e)) from e
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        pool.putconn(conn, broken=broken)
+
+
+def _fetch(query, params=None, one=False):
+    """Run a read query on a pooled connection and return one row or all rows"""
+    with get_connection() as conn:
+        if isinstance(conn, sqlite3.Connection):
+            query, params = query.replace("%s", "?"), params or ()
+        start = time.perf_counter()
+        with closing(conn.cursor()) as cur:
+            cur.execute(query, params)
+            result = cur.fetchone() if one else cur.fetchall()
+        record_query(int(result is not None) if one else len(result), estimate_bytes(result),
+                     time.perf_counter() - start)
+        return result
+
+
+def stream_rows(conn, query, params=None, fetch_size=STREAM_FETCH_SIZE, chunks=False, call=None):
+    """Yield the rows of a query (or lists of up to fetch_size rows with ``chunks``) without fetching them all.
+
+    PostgreSQL uses a named server-side cursor; on an autocommit connection it runs in a
+    transaction of its own that is rolled back afterwards. SQLite cursors are stepped lazily.
+    Close the generator (or exhaust it) to release the cursor. ``call`` names the query in metrics.
+    """
+    fetch_size = int(fetch_size)
+    own_transaction, cur = False, None
+    start, rows, nbytes = time.perf_counter(), 0, 0
+    try:
+        if isinstance(conn, sqlite3.Connection):
+            cur = conn.cursor()
+            cur.execute(query.replace("%s", "?"), params or ())
+        else:
+            if conn.autocommit:  # server-side cursors only live inside a transaction
+                conn.autocommit, own_transaction = False, True
+            cur = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+            cur.itersize = fetch_size
+            cur.execute(query, params)
+        while True:
+            chunk = cur.fetchmany(fetch_size)
+            if not chunk:
+                break
+            rows += len(chunk)
+            nbytes += estimate_bytes(chunk)
+            if chunks:
+                yield chunk
+            else:
+                yield from chunk
+    finally:
+        try:
+            if cur is not None:
+                cur.close()
+        finally:
+            if own_transaction:  # hand the connection back to the pool as it was lent out
+                conn.rollback()
+                conn.autocommit = True
+            record_query(rows, nbytes, time.perf_counter() - start, call)
 
+
+def _is_missing_table(error):
+    """Whether a query failed because an optional table (e.g. shop_nearest_center) does not exist"""
+    if isinstance(error, sqlite3.OperationalError):
+        return str(error).startswith("no such table")
+    return isinstance(error, psycopg2.errors.UndefinedTable)
+
+
+@st.cache_resource(show_spinner=False)
+def has_row_versions():
+    """Whether centers and shops carry row versions and soft deletes (schema version 4, see migrate.py)"""
+    with get_connection() as conn:
+        with closing(conn.cursor()) as cur:
+            cur.execute("SELECT * FROM shops LIMIT 0")
+            return "deleted_at" in {column[0] for column in cur.description}
+
+def _not_deleted(keyword, alias=""):
+    """SQL condition (after ``keyword``) skipping soft-deleted rows, or "" before schema version 4"""
+    return f" {keyword} {alias}deleted_at IS NULL" if has_row_versions() else ""
+
+
+@timed()
 def get_center(center_id):
     """Get Walmart center information by ID"""
-    conn = get_db_connection()
-    if conn is None:
-        return None
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT id, name, lat, lon FROM centers WHERE id = %s", (center_id,))
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
-        return row
+        return _fetch(
+            f"SELECT id, name, lat, lon FROM centers WHERE id = %s{_not_deleted('AND')}", (center_id,), one=True
+        )
+    except DatabaseConnectionError:
+        return None
     except Exception as e:
         st.error(f"Error fetching center data: {str(e)}")
         return None
 
+@timed()
 def get_all_centers():
     """Get all Walmart centers"""
-    conn = get_db_connection()
-    if conn is None:
-        return []
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT id, name, lat, lon FROM centers ORDER BY id")
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
-        return rows
+        return _fetch(f"SELECT id, name, lat, lon FROM centers{_not_deleted('WHERE')} ORDER BY id")
+    except DatabaseConnectionError:
+        return []
     except Exception as e:
         st.error(f"Error fetching all centers data: {str(e)}")
         return []
 
+@timed()
 def get_shops():
-    """Get all shops with risk analysis"""
-    conn = get_db_connection()
-    if conn is None:
-        return []
+    """Get all shops with risk analysis (as one list; use stream_shops for large tables)"""
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT id, name, lat, lon, risk, analysis FROM shops")
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
-        return rows
+        return _fetch(f"SELECT id, name, lat, lon, risk, analysis FROM shops{_not_deleted('WHERE')}")
+    except DatabaseConnectionError:
+        return []
     except Exception as e:
         st.error(f"Error fetching shops data: {str(e)}")
         return []
 
-def get_shops_by_risk(risk_level):
-    """Get shops filtered by risk level"""
-    conn = get_db_connection()
-    if conn is None:
+def _build_shop_filter(risk_levels=None, bbox=None, geohash=False):
+    """WHERE clause and parameters for a risk-level set and an optional (min_lat, min_lon, max_lat, max_lon) box.
+
+    With ``geohash`` the box is also turned into geohash prefix range scans (needs schema version 3).
+    Soft-deleted shops are always left out.
+    """
+    clauses, params = [], []
+    if has_row_versions():
+        clauses.append("deleted_at IS NULL")
+    if risk_levels is not None:
+        levels = sorted({level.lower() for level in risk_levels})
+        clauses.append(f"risk IN ({', '.join(['%s'] * len(levels))})")
+        params.extend(levels)
+    if bbox is not None and geohash:
+        prefixes = geohash_prefixes(bbox, GEOHASH_MAX_PREFIXES)
+        clauses.append(f"({' OR '.join(['(geohash >= %s AND geohash < %s)'] * len(prefixes))})")
+        for prefix in prefixes:
+            params.extend([prefix, prefix + "{"])  # '{' sorts right after 'z'
+    if bbox is not None:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        clauses.append("lat BETWEEN %s AND %s AND lon BETWEEN %s AND %s")
+        params.extend([min_lat, max_lat, min_lon, max_lon])
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, params
+
+
+@timed()
+def query_shops(risk_levels=None, bbox=None, limit=None, geohash=False):
+    """Get shops matching a set of risk levels, an optional lat/lon bounding box and a row limit.
+
+    Rows are slim listings (id, name, lat, lon, risk, analysis_preview); use get_shop_by_id
+    for the full analysis text. ``geohash`` looks the box up through geohash prefix scans.
+    """
+    if risk_levels is not None and not risk_levels:
         return []
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT id, name, lat, lon, risk, analysis FROM shops WHERE risk = %s", (risk_level,))
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
-        return rows
+        where, params = _build_shop_filter(risk_levels, bbox, geohash)
+        query = f"SELECT {SHOP_LISTING_COLUMNS} FROM shops{where} ORDER BY id"
+        if limit is not None:
+            query += " LIMIT %s"
+            params.append(int(limit))
+        return _fetch(query, params)
+    except DatabaseConnectionError:
+        return []
     except Exception as e:
         st.error(f"Error fetching filtered shops data: {str(e)}")
         return []
 
+@timed()
+def query_shops_within_radius(lat, lon, radius_km, risk_levels=None, limit=None):
+    """Shops within radius_km of a point as (row, distance_km) pairs, closest first (geohash prefix scans)"""
+    rows = query_shops(risk_levels, radius_bbox(float(lat), float(lon), radius_km), geohash=True)
+    if not rows:
+        return []
+    distances = haversine_km(float(lat), float(lon), [row[2] for row in rows], [row[3] for row in rows])
+    order = [i for i in np.argsort(distances, kind="stable") if distances[i] <= radius_km]
+    return [(rows[i], float(distances[i])) for i in order[:limit]]
+
+def stream_shops(risk_levels=None, bbox=None, full_analysis=False, fetch_size=None, chunks=False):
+    """Stream shops matching the filters in id order with a server-side cursor, in constant memory.
+
+    Yields slim listing rows (full analysis text with ``full_analysis``), one at a time or as
+    lists of up to fetch_size rows with ``chunks``. Holds a pooled connection until exhausted or closed.
+    """
+    if risk_levels is not None and not risk_levels:
+        return
+    columns = "id, name, lat, lon, risk, analysis" if full_analysis else SHOP_LISTING_COLUMNS
+    fetch_size = fetch_size or get_setting("DB_STREAM_FETCH_SIZE", STREAM_FETCH_SIZE)
+    try:
+        where, params = _build_shop_filter(risk_levels, bbox)
+        with get_connection() as conn:
+            query = f"SELECT {columns} FROM shops{where} ORDER BY id"
+            yield from stream_rows(conn, query, params, fetch_size, chunks, call="db.stream_shops")
+    except DatabaseConnectionError:
+        return
+    except Exception as e:
+        st.error(f"Error streaming shops data: {str(e)}")
+
+@timed()
+def get_shops_by_risk(risk_level):
+    """Get shops filtered by risk level (slim listing rows)"""
+    return query_shops(risk_levels=[risk_level])
+
+@timed()
 def get_shop_by_id(shop_id):
     """Get specific shop by ID"""
-    conn = get_db_connection()
-    if conn is None:
-        return None
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT id, name, lat, lon, risk, analysis FROM shops WHERE id = %s", (shop_id,))
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
-        return row
+        return _fetch(
+            f"SELECT id, name, lat, lon, risk, analysis FROM shops WHERE id = %s{_not_deleted('AND')}",
+            (shop_id,), one=True
+        )
+    except DatabaseConnectionError:
+        return None
     except Exception as e:
         st.error(f"Error fetching shop data: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+@timed()
+def get_risk_counts(center_id=None, bbox=None):
+    """Count shops per risk level, optionally only those nearest to a center and/or inside a bounding box"""
+    try:
+        where, params = _build_shop_filter(bbox=bbox)
+        join = ""
+        if center_id is not None:
+            join = " JOIN shop_nearest_center a ON a.shop_id = shops.id"
+            where += f"{' AND' if where else ' WHERE'} a.center_id = %s"
+            params.append(int(center_id))
+        return dict(_fetch(f"SELECT lower(risk), COUNT(*) FROM shops{join}{where} GROUP BY lower(risk)", params))
+    except DatabaseConnectionError:
+        return {}
+    except Exception as e:
+        if _is_missing_table(e):
+            return {}  # per-center counts need the assignments from assign_centers.py
+        st.error(f"Error fetching risk statistics: {str(e)}")
+        return {}
+
+@timed()
+def get_shop_assignment(shop_id):
+    """Get the precomputed nearest center for a shop with the coordinates it was computed from.
+
+    Returns (center_id, distance_km, shop_lat, shop_lon, center_lat, center_lon); the center
+    coordinates are None if the center was not part of the last assignment run.
+    """
+    try:
+        return _fetch("""
+            SELECT a.center_id, a.distance_km, a.shop_lat, a.shop_lon, c.lat, c.lon
+            FROM shop_nearest_center a LEFT JOIN assigned_centers c ON c.center_id = a.center_id
+            WHERE a.shop_id = %s
+        """, (shop_id,), one=True)
+    except DatabaseConnectionError:
+        return None
+    except Exception as e:
+        if _is_missing_table(e):
+            return None  # assign_centers.py has not been run against this database yet
+        st.error(f"Error fetching nearest center assignment: {str(e)}")
+        return None
+
+@timed()
+def get_center_risk_counts():
+    """Count shops per risk level for every center, keyed by the center the shops are nearest to"""
+    try:
+        rows = _fetch(f"""
+            SELECT a.center_id, lower(s.risk), COUNT(*)
+            FROM shops s JOIN shop_nearest_center a ON a.shop_id = s.id{_not_deleted('WHERE', 's.')}
+            GROUP BY a.center_id, lower(s.risk)
+        """)
+    except DatabaseConnectionError:
+        return {}
+    except Exception as e:
+        if _is_missing_table(e):
+            return {}  # per-center counts need the assignments from assign_centers.py
+        st.error(f"Error fetching risk statistics: {str(e)}")
+        return {}
+    counts = {}
+    for center_id, risk, count in rows:
+        counts.setdefault(center_id, {})[risk] = count
+    return counts
+
+@timed()
+def get_sync_watermark():
+    """Lowest row version a change not yet visible could still get; None before schema version 4 or on errors.
+
+    On PostgreSQL versions are transaction ids, so this is the oldest transaction still running:
+    anything written by an older one has already committed (or rolled back). SQLite runs one
+    writer at a time, so it is simply the next value of the version counter.
+    """
+    try:
+        if not has_row_versions():
+            return None
+        if get_backend() == "sqlite":
+            return _fetch("SELECT value + 1 FROM row_version WHERE id = 1", one=True)[0]
+        return _fetch("SELECT txid_snapshot_xmin(txid_current_snapshot())", one=True)[0]
+    except DatabaseConnectionError:
+        return None
+    except Exception as e:
+        st.error(f"Error fetching row version: {str(e)}")
+        return None
+
+def _changed_shop_rows(since_version):
+    """Changed shop listing rows with a deleted flag and their stored nearest center (or None)"""
+    query = (
+        f"SELECT {SHOP_LISTING_COLUMNS}, deleted_at IS NOT NULL, {{center}} FROM shops{{join}} "
+        "WHERE version >= %s ORDER BY id"
+    )
+    try:
+        return _fetch(
+            query.format(center="a.center_id", join=" LEFT JOIN shop_nearest_center a ON a.shop_id = shops.id"),
+            (since_version,)
+        )
+    except Exception as e:
+        if not _is_missing_table(e):
+            raise
+        return _fetch(query.format(center="NULL", join=""), (since_version,))  # assign_centers.py not run yet
+
+@timed()
+def get_changes(since_watermark):
+    """Centers and shops inserted, updated or soft-deleted since a get_sync_watermark() value, for delta sync.
+
+    Returns Changes with live rows shaped like get_all_centers / query_shops rows, the ids of
+    soft-deleted rows, the stored nearest center of every changed shop, and the watermark to
+    pass next time; None if they could not be read. Rows written by transactions that were
+    still running last time are read again, so the result may repeat rows already merged.
+    """
+    watermark = get_sync_watermark()  # before the rows, so anything committed meanwhile is read again
+    if watermark is None:
+        return None  # no row versions, or the database could not be reached
+    try:
+        center_rows = _fetch(
+            "SELECT id, name, lat, lon, deleted_at IS NOT NULL FROM centers WHERE version >= %s ORDER BY id",
+            (since_watermark,)
+        )
+        shop_rows = _changed_shop_rows(since_watermark)
+    except DatabaseConnectionError:
+        return None
+    except Exception as e:
+        st.error(f"Error fetching changed rows: {str(e)}")
+        return None
+    return Changes(
+        [row[:-1] for row in center_rows if not row[-1]],
+        [row[:-2] for row in shop_rows if not row[-2]],
+        [row[0] for row in center_rows if row[-1]],
+        [row[0] for row in shop_rows if row[-2]],
+        {row[0]: row[-1] for row in shop_rows},
+        watermark,
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_query_executor():
+    """Process-wide worker threads for running independent queries concurrently on pooled connections.
+
+    One worker per pooled connection by default (DB_QUERY_WORKERS overrides it): more could only
+    wait for a connection.
+    """
+    workers = get_setting("DB_QUERY_WORKERS", get_setting("DB_POOL_MAX", 10))
+    return ThreadPoolExecutor(max_workers=int(workers), thread_name_prefix="db-query")
+
+def in_worker(fn):
+    """Wrap fn to run on a worker thread with the caller's Streamlit script context and metrics rerun"""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    fn = bind(fn)
+
+    def run(*args, **kwargs):
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)  # so st.error reaches the caller's page
+        return fn(*args, **kwargs)
+    return run
+
+@timed()
+def get_page_data(center_id=None, risk_levels=None, bbox=None, limit=None):
+    """Everything a page render reads from the database, for the latency of a single round trip.
+
+    All centers, the shops matching the filters (slim listing rows), shops per risk level and
+    per-center risk counts are queried concurrently, each on its own pooled connection, so a
+    render waits for the slowest query instead of the sum of them. Returns PageData with the
+    focused center (or None) picked from the centers.
+    """
+    try:
+        center_id = int(center_id) if center_id is not None else None
+    except (TypeError, ValueError):
+        center_id = None  # not a center id; the page gets no focused center
+    executor = get_query_executor()
+    centers = executor.submit(in_worker(get_all_centers))
+    shops = executor.submit(in_worker(query_shops), risk_levels, bbox, limit)
+    risk_counts = executor.submit(in_worker(get_risk_counts))
+    center_risk_counts = executor.submit(in_worker(get_center_risk_counts))
+    centers = centers.result()
+    center = next((c for c in centers if c[0] == center_id), None) if center_id is not None else None
+    return PageData(center, centers, shops.result(), risk_counts.result(), center_risk_counts.result())
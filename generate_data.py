@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Synthetic data generator for Walmart Risk Detection System
+Produces N Walmart centers and M supplier shops for load and performance testing.
+
+Centers are spread over a set of metro areas in the continental US, and shops
+cluster around centers (some centers serve far more shops than others). Risk
+levels and analysis text lengths follow the hand-written sample data. Shops are
+generated in fixed blocks seeded from (seed, block), so the same seed always
+gives the same rows regardless of chunk size, and rows are streamed into the
+database chunk by chunk with bounded memory.
+"""
+
+import argparse
+import math
+import os
+import time
+from itertools import islice
+
+import numpy as np
+
+from assign_centers import assign_nearest_centers
+from bulk_load import replace_tables, report
+from db import connect_db, is_sqlite
+from migrate import migrate
+
+# Continental US (min_lat, min_lon, max_lat, max_lon)
+US_BBOX = (25.0, -124.5, 49.0, -67.0)
+CENTERS_PER_METRO = 10
+METRO_SPREAD_DEG = 0.5
+SHOP_DISTANCE_MEDIAN_KM = 2.0
+
+# Matches the sample data in setup_database.py
+RISK_WEIGHTS = {"low": 0.46, "medium": 0.32, "high": 0.22}
+ANALYSIS_LENGTH = {"low": (140, 25), "medium": (157, 30), "high": (170, 35)}  # (mean, std) in characters
+ANALYSIS_LENGTH_RANGE = (100, 320)
+
+BLOCK_ROWS = 10_000
+CHUNK_ROWS = 50_000
+
+NAME_PREFIXES = (
+    "Liberty", "Summit", "Prairie", "Coastal", "Metro", "Frontier", "Lakeside", "Pioneer", "Heritage", "Valley",
+    "Capital", "Evergreen", "Golden", "Harbor", "Northern", "Southern", "Canyon", "Riverside", "Eagle", "Union",
+)
+NAME_CATEGORIES = (
+    "Electronics", "Fresh Foods", "Apparel", "Auto Parts", "Home & Garden", "Sporting Goods", "Beauty Products",
+    "Pharmacy Supplies", "Toys", "Office Supplies", "Hardware", "Seafood", "Textiles", "Medical Supplies",
+    "Pet Supplies", "Furniture", "Logistics", "Packaging", "Beverages", "Cleaning Products",
+)
+NAME_SUFFIXES = ("Inc", "Co", "Distributors", "Supply", "Hub", "Group", "Partners", "Wholesale", "Traders", "Depot")
+
+ANALYSIS_SENTENCES = {
+    "low": (
+        "Excellent supplier performance with consistent on-time delivery.",
+        "Strong quality certifications and a clean compliance record.",
+        "Competitive pricing and reliable inventory levels year-round.",
+        "Sustainable sourcing practices and strong ESG reporting.",
+        "Recommended for long-term strategic partnership.",
+        "Digital integration capabilities support automated ordering.",
+        "Customer satisfaction scores are well above category average.",
+        "Suitable for expanded category coverage.",
+    ),
+    "medium": (
+        "Moderate risk due to seasonal capacity constraints.",
+        "Good product quality but delivery performance varies during peak periods.",
+        "Inventory management needs improvement.",
+        "Financial stability should be reviewed before contract renewal.",
+        "Backup supplier arrangements recommended.",
+        "Limited cold chain infrastructure affects some shipments.",
+        "Capacity planning review needed ahead of the holiday season.",
+        "Documentation complexity slows customs clearance.",
+    ),
+    "high": (
+        "High risk supplier with repeated safety compliance violations.",
+        "Failed recent quality inspections and product recalls reported.",
+        "Delayed shipments affecting a significant share of orders.",
+        "Financial instability detected in the latest review.",
+        "Immediate corrective action and compliance audit required.",
+        "Environmental citations and improper storage procedures found.",
+        "Alternative supplier sourcing recommended.",
+        "Suspension recommended pending full audit.",
+    ),
+}
+
+SCHEMA = {
+    "postgresql": [
+        """
+        CREATE TABLE IF NOT EXISTS centers (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            lat DOUBLE PRECISION NOT NULL,
+            lon DOUBLE PRECISION NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS shops (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            lat DOUBLE PRECISION NOT NULL,
+            lon DOUBLE PRECISION NOT NULL,
+            risk VARCHAR(20) NOT NULL CHECK (risk IN ('low', 'medium', 'high')),
+            analysis TEXT NOT NULL
+        )
+        """,
+    ],
+    "sqlite": [
+        """
+        CREATE TABLE centers (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE shops (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL,
+            risk TEXT NOT NULL,
+            analysis TEXT NOT NULL
+        )
+        """,
+    ],
+}
+
+
+def generate_centers(count, seed=42):
+    """List of (id, name, lat, lon) center rows grouped into metro areas"""
+    rng = np.random.default_rng([seed, 0])
+    min_lat, min_lon, max_lat, max_lon = US_BBOX
+    metros = max(1, math.ceil(count / CENTERS_PER_METRO))
+    metro_lats = rng.uniform(min_lat, max_lat, metros)
+    metro_lons = rng.uniform(min_lon, max_lon, metros)
+    metro = rng.integers(0, metros, count)
+    lats = np.clip(metro_lats[metro] + rng.normal(0, METRO_SPREAD_DEG, count), min_lat, max_lat)
+    lons = np.clip(metro_lons[metro] + rng.normal(0, METRO_SPREAD_DEG, count), min_lon, max_lon)
+    return [
+        (i + 1, f"Walmart Supercenter #{i + 1}", round(float(lat), 6), round(float(lon), 6))
+        for i, (lat, lon) in enumerate(zip(lats, lons))
+    ]
+
+
+def _center_weights(count, seed):
+    # Lognormal popularity: a few centers serve many shops, most serve a handful
+    weights = np.random.default_rng([seed, 1]).lognormal(0.0, 1.0, count)
+    return weights / weights.sum()
+
+
+def _analysis(rng, risk, count):
+    sentences = ANALYSIS_SENTENCES[risk]
+    mean, std = ANALYSIS_LENGTH[risk]
+    targets = np.clip(rng.normal(mean, std, count), *ANALYSIS_LENGTH_RANGE)
+    orders = rng.permuted(np.tile(np.arange(len(sentences)), (count, 1)), axis=1)
+    texts = []
+    for target, order in zip(targets.tolist(), orders.tolist()):
+        parts, length = [], 0
+        for index in order:
+            # Stop at the sentence boundary closest to the target length
+            if parts and length + len(sentences[index]) / 2 > target:
+                break
+            parts.append(sentences[index])
+            length += len(sentences[index]) + 1
+        texts.append(" ".join(parts))
+    return texts
+
+
+def _shop_block(block, start_id, count, centers, weights, seed):
+    rng = np.random.default_rng([seed, 2, block])
+    center_lats = np.array([c[2] for c in centers])
+    center_lons = np.array([c[3] for c in centers])
+
+    home = rng.choice(len(centers), count, p=weights)
+    distance_km = rng.lognormal(math.log(SHOP_DISTANCE_MEDIAN_KM), 0.8, count)
+    bearing = rng.uniform(0, 2 * math.pi, count)
+    lats = np.clip(center_lats[home] + distance_km * np.cos(bearing) / 111.32, -90.0, 90.0)
+    lons = center_lons[home] + distance_km * np.sin(bearing) / (111.32 * np.cos(np.radians(lats)).clip(0.01))
+    lons = np.clip(lons, -180.0, 180.0)
+
+    levels = list(RISK_WEIGHTS)
+    risks = rng.choice(len(levels), count, p=list(RISK_WEIGHTS.values()))
+    analyses = [None] * count
+    for code, level in enumerate(levels):
+        positions = np.flatnonzero(risks == code)
+        for pos, text in zip(positions.tolist(), _analysis(rng, level, len(positions))):
+            analyses[pos] = text
+
+    prefixes = rng.integers(0, len(NAME_PREFIXES), count).tolist()
+    categories = rng.integers(0, len(NAME_CATEGORIES), count).tolist()
+    suffixes = rng.integers(0, len(NAME_SUFFIXES), count).tolist()
+    for i in range(count):
+        yield (
+            start_id + i,
+            f"{NAME_PREFIXES[prefixes[i]]} {NAME_CATEGORIES[categories[i]]} {NAME_SUFFIXES[suffixes[i]]}",
+            round(float(lats[i]), 6),
+            round(float(lons[i]), 6),
+            levels[risks[i]],
+            analyses[i],
+        )
+
+
+def iter_shops(count, centers, seed=42):
+    """Lazily yield (id, name, lat, lon, risk, analysis) shop rows clustered around centers"""
+    weights = _center_weights(len(centers), seed)
+    for block, start in enumerate(range(0, count, BLOCK_ROWS)):
+        yield from _shop_block(block, start + 1, min(BLOCK_ROWS, count - start), centers, weights, seed)
+
+
+def load_sqlite(conn, centers, shops, chunk_size=CHUNK_ROWS):
+    """Insert generated rows into fresh SQLite tables chunk by chunk; returns [(table, rows, seconds)]"""
+    cursor = conn.cursor()
+    for statement in SCHEMA["sqlite"]:
+        cursor.execute(statement)
+    stats = []
+    for table, placeholders, rows in (("centers", "?, ?, ?, ?", centers), ("shops", "?, ?, ?, ?, ?, ?", shops)):
+        start, count = time.perf_counter(), 0
+        rows = iter(rows)
+        while chunk := list(islice(rows, chunk_size)):
+            cursor.executemany(f"INSERT INTO {table} VALUES ({placeholders})", chunk)
+            count += len(chunk)
+        stats.append((table, count, time.perf_counter() - start))
+    conn.commit()
+    cursor.close()
+    return stats
+
+
+def load_postgresql(conn, centers, shop_rows):
+    """Replace PostgreSQL centers and shops with generated rows; returns (method, [(table, rows, seconds)])"""
+    cursor = conn.cursor()
+    for statement in SCHEMA["postgresql"]:
+        cursor.execute(statement)
+    conn.commit()
+    # Run migrations first so the geohash triggers fill the new rows
+    migrate(conn)
+    method, stats = replace_tables(conn, [
+        ("centers", ("id", "name", "lat", "lon"), lambda: centers),
+        ("shops", ("id", "name", "lat", "lon", "risk", "analysis"), shop_rows),
+    ])
+    cursor.execute("SELECT setval('centers_id_seq', (SELECT MAX(id) FROM centers))")
+    cursor.execute("SELECT setval('shops_id_seq', (SELECT MAX(id) FROM shops))")
+    cursor.close()
+    return method, stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic centers and shops for load testing")
+    parser.add_argument("--centers", type=int, default=5000, help="Number of Walmart centers (default: 5000)")
+    parser.add_argument("--shops", type=int, default=1_000_000, help="Number of shops (default: 1000000)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (same seed, same data)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_ROWS, help="Rows per insert chunk")
+    parser.add_argument("--sqlite", metavar="PATH", help="SQLite database file to (re)create (default: PostgreSQL from .env)")
+    args = parser.parse_args()
+
+    print("🧪 Walmart Risk Detection - Synthetic Data Generator")
+    print("=" * 55)
+    print(f"📋 {args.centers} centers, {args.shops} shops, seed {args.seed}")
+
+    if args.sqlite and os.path.exists(args.sqlite):
+        os.remove(args.sqlite)
+
+    centers = generate_centers(args.centers, args.seed)
+    conn = connect_db(args.sqlite)
+    try:
+        if is_sqlite(conn):
+            # Fresh file: skip the journal while bulk loading, indexes and geohash keys are built afterwards
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            method = "executemany"
+            stats = load_sqlite(conn, centers, iter_shops(args.shops, centers, args.seed), args.chunk_size)
+            migrate(conn)
+        else:
+            method, stats = load_postgresql(conn, centers, lambda: iter_shops(args.shops, centers, args.seed))
+        print("✅ Data loaded!")
+        report(method, stats)
+
+        start = time.perf_counter()
+        assign_nearest_centers(conn, full=True)
+        conn.commit()
+        print(f"✅ Nearest centers assigned in {time.perf_counter() - start:.2f}s")
+    finally:
+        conn.close()
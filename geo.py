@@ -0,0 +1,285 @@
+"""
+Vectorized geographic helpers for the Walmart Risk Detection app
+
+Distances are great-circle (haversine) distances in kilometres. Spatial queries
+go through a KD-tree over unit-sphere 3D coordinates: the straight-line (chord)
+distance between two points on the sphere grows monotonically with their
+great-circle distance, so nearest and within-radius answers are exact.
+"""
+
+import math
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Haversine distance in km between coordinates given in degrees (broadcasts like NumPy)"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def to_unit_xyz(lats, lons):
+    """Unit-sphere 3D coordinates, shape (n, 3), for latitudes/longitudes in degrees"""
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def km_to_chord(km):
+    """Unit-sphere chord length spanning a great-circle distance in km"""
+    return 2 * np.sin(np.minimum(np.asarray(km, dtype=np.float64), np.pi * EARTH_RADIUS_KM) / (2 * EARTH_RADIUS_KM))
+
+
+def chord_to_km(chord):
+    """Great-circle distance in km spanned by a unit-sphere chord length"""
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord, dtype=np.float64) / 2, 0.0, 1.0))
+
+
+def clamp_bbox(bbox):
+    """Clamp a (min_lat, min_lon, max_lat, max_lon) box to valid coordinates"""
+    min_lat, min_lon, max_lat, max_lon = bbox
+    return (max(min_lat, -90.0), max(min_lon, -180.0), min(max_lat, 90.0), min(max_lon, 180.0))
+
+
+def expand_bbox(bbox, margin):
+    """Grow a bounding box by ``margin`` times its height/width on every side"""
+    min_lat, min_lon, max_lat, max_lon = bbox
+    dlat = (max_lat - min_lat) * margin
+    dlon = (max_lon - min_lon) * margin
+    return clamp_bbox((min_lat - dlat, min_lon - dlon, max_lat + dlat, max_lon + dlon))
+
+
+def estimate_bounds(lat, lon, zoom, width_px, height_px):
+    """Approximate bounding box shown by a Web Mercator map of the given pixel size"""
+    deg_per_px = 360.0 / (256 * 2 ** zoom)
+    half_lon = width_px / 2 * deg_per_px
+    half_lat = height_px / 2 * deg_per_px * math.cos(math.radians(lat))
+    return clamp_bbox((lat - half_lat, lon - half_lon, lat + half_lat, lon + half_lon))
+
+
+def radius_bbox(lat, lon, radius_km):
+    """Smallest (min_lat, min_lon, max_lat, max_lon) box containing a circle on the sphere"""
+    angle = min(radius_km / EARTH_RADIUS_KM, math.pi)
+    dlat = math.degrees(angle)
+    cos_lat = math.cos(math.radians(lat))
+    if math.sin(angle) < cos_lat:
+        dlon = math.degrees(math.asin(math.sin(angle) / cos_lat))
+    else:
+        dlon = 180.0  # the circle reaches a pole
+    return clamp_bbox((lat - dlat, lon - dlon, lat + dlat, lon + dlon))
+
+
+# Geohash: base32 cells from interleaved longitude/latitude bits. Coordinates are
+# quantized as floor((value + offset) / span * 2**bits), which is easy to reproduce
+# exactly in SQL (see migrate.py), so Python and both databases agree on every key.
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9  # characters stored per row, cells of roughly 5 x 5 m
+
+
+def geohash_bits(precision):
+    """Number of (longitude, latitude) bits in a geohash of the given length"""
+    total = 5 * precision
+    return (total + 1) // 2, total // 2
+
+
+def _quantize(values, offset, span, nbits):
+    scaled = np.floor((np.asarray(values, dtype=np.float64) + offset) / span * float(1 << nbits))
+    return np.clip(scaled.astype(np.int64), 0, (1 << nbits) - 1)
+
+
+def geohash_encode_many(lats, lons, precision=GEOHASH_PRECISION):
+    """Geohashes of a batch of points, as a list of strings"""
+    lon_bits, lat_bits = geohash_bits(precision)
+    lon_q = _quantize(lons, 180.0, 360.0, lon_bits)
+    lat_q = _quantize(lats, 90.0, 180.0, lat_bits)
+    codes = np.zeros((len(lon_q), precision), dtype=np.int64)
+    for i in range(5 * precision):
+        # Even bits come from the longitude, odd bits from the latitude, most significant first
+        q, nbits = (lon_q, lon_bits) if i % 2 == 0 else (lat_q, lat_bits)
+        codes[:, i // 5] = codes[:, i // 5] * 2 + ((q >> (nbits - 1 - i // 2)) & 1)
+    chars = np.frombuffer(GEOHASH_ALPHABET.encode(), dtype=np.uint8)[codes]
+    return np.ascontiguousarray(chars).view(f"S{precision}").ravel().astype(str).tolist()
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    """Geohash of one point"""
+    return geohash_encode_many([lat], [lon], precision)[0]
+
+
+def geohash_prefixes(bbox, max_cells=16):
+    """Geohash prefixes whose cells cover a bounding box.
+
+    Uses the longest prefix length (up to GEOHASH_PRECISION) that needs at most
+    ``max_cells`` cells, so a box becomes a handful of index range scans.
+    """
+    min_lat, min_lon, max_lat, max_lon = clamp_bbox(bbox)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lon_bits, lat_bits = geohash_bits(precision)
+        x0, x1 = _quantize([min_lon, max_lon], 180.0, 360.0, lon_bits)
+        y0, y1 = _quantize([min_lat, max_lat], 90.0, 180.0, lat_bits)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= max_cells or precision == 1:
+            break
+    # Encode the center of every covering cell
+    xs, ys = np.meshgrid(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1))
+    lons = (xs.ravel() + 0.5) * 360.0 / (1 << lon_bits) - 180.0
+    lats = (ys.ravel() + 0.5) * 180.0 / (1 << lat_bits) - 90.0
+    return sorted(set(geohash_encode_many(lats, lons, precision)))
+
+
+def bbox_tiles(bbox, zoom, max_tiles=16):
+    """Fixed grid tiles covering a bounding box, as bounding boxes.
+
+    The grid has 2**z cells around the globe (cells are 360 / 2**z degrees square);
+    z starts at the map zoom and is coarsened until at most ``max_tiles`` cells are
+    needed, so the same view always maps onto the same cache-friendly tiles.
+    """
+    min_lat, min_lon, max_lat, max_lon = clamp_bbox(bbox)
+    z = max(0, int(zoom))
+    while True:
+        size = 360.0 / 2 ** z
+        cells = 2 ** z
+        x0 = min(int((min_lon + 180.0) // size), cells - 1)
+        x1 = min(int((max_lon + 180.0) // size), cells - 1)
+        y0 = int((min_lat + 90.0) // size)
+        y1 = int((max_lat + 90.0) // size)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= max_tiles or z == 0:
+            break
+        z -= 1
+    return [
+        (y * size - 90.0, x * size - 180.0, (y + 1) * size - 90.0, (x + 1) * size - 180.0)
+        for y in range(y0, y1 + 1)
+        for x in range(x0, x1 + 1)
+    ]
+
+
+def _columns(rows):
+    """Rows plus their id, lat and lon arrays; columnar tables (shop_table.ShopTable) are used as-is"""
+    if all(hasattr(rows, column) for column in ("ids", "lats", "lons")):
+        return rows, rows.ids, rows.lats, rows.lons
+    rows = tuple(rows)
+    return (
+        rows,
+        np.array([row[0] for row in rows], dtype=np.int64),
+        np.array([float(row[2]) for row in rows], dtype=np.float64),
+        np.array([float(row[3]) for row in rows], dtype=np.float64),
+    )
+
+
+class SpatialIndex:
+    """KD-tree over (id, name, lat, lon, ...) rows answering k-nearest and radius queries.
+
+    Rows are kept as given; only their coordinates are copied into float64 arrays
+    (or taken directly from a columnar table). Results refer back to rows by
+    position so callers get their original tuples.
+    """
+
+    def __init__(self, rows):
+        self.rows, self.ids, self.lats, self.lons = _columns(rows)
+        self._tree = cKDTree(to_unit_xyz(self.lats, self.lons)) if len(self.rows) else None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def query(self, lat, lon, k=1):
+        """Positions and distances in km of the k nearest rows, closest first"""
+        if self._tree is None or k <= 0:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        k = min(k, len(self.rows))
+        chord, idx = self._tree.query(to_unit_xyz([lat], [lon])[0], k=k)
+        return np.atleast_1d(idx), chord_to_km(np.atleast_1d(chord))
+
+    def nearest_many(self, lats, lons):
+        """Nearest row id and distance in km for a batch of points, as two arrays"""
+        lats = np.asarray(lats, dtype=np.float64)
+        if self._tree is None:
+            return np.full(len(lats), -1, dtype=np.int64), np.full(len(lats), np.inf)
+        chord, idx = self._tree.query(to_unit_xyz(lats, lons), k=1)
+        return self.ids[idx], chord_to_km(chord)
+
+    def within_radius(self, lat, lon, radius_km):
+        """Rows within radius_km of a point as (row, distance_km) pairs, closest first"""
+        if self._tree is None:
+            return []
+        idx = np.asarray(self._tree.query_ball_point(to_unit_xyz([lat], [lon])[0], km_to_chord(radius_km)), dtype=np.intp)
+        dist = haversine_km(lat, lon, self.lats[idx], self.lons[idx])
+        order = np.argsort(dist)
+        return [(self.rows[i], float(d)) for i, d in zip(idx[order], dist[order])]
+
+    def within_radius_many(self, lats, lons, radius_km):
+        """For each point, the positions of rows within radius_km (one list per point)"""
+        if self._tree is None:
+            return [[] for _ in range(len(lats))]
+        return list(self._tree.query_ball_point(to_unit_xyz(lats, lons), km_to_chord(radius_km)))
+
+
+class CenterLocator(SpatialIndex):
+    """Nearest-center engine over (id, name, lat, lon) center rows.
+
+    Results are returned as center rows with float coordinates.
+    """
+
+    def __init__(self, centers):
+        super().__init__((cid, name, float(lat), float(lon)) for cid, name, lat, lon in centers)
+
+    @property
+    def centers(self):
+        return self.rows
+
+    def distances(self, lat, lon):
+        """Distance in km from one point to every center, in center order"""
+        return haversine_km(lat, lon, self.lats, self.lons)
+
+    def nearest(self, lat, lon):
+        """Nearest center row and its distance in km, or (None, inf) when there are no centers"""
+        idx, dist = self.query(lat, lon, k=1)
+        if not len(idx):
+            return None, float('inf')
+        return self.rows[idx[0]], float(dist[0])
+
+    def top_k(self, lat, lon, k):
+        """The k nearest center rows with distances, closest first"""
+        idx, dist = self.query(lat, lon, k=k)
+        return [(self.rows[i], float(d)) for i, d in zip(idx, dist)]
+
+
+class GridIndex:
+    """Fixed-cell spatial hash over (id, name, lat, lon, ...) rows for point lookups.
+
+    Rows are bucketed into ``cell_deg`` degree cells, so finding the row at a point
+    only looks at the 3x3 cells around it, however many rows there are.
+    """
+
+    def __init__(self, rows, cell_deg=0.01):
+        self.rows, _, self.lats, self.lons = _columns(rows)
+        self.cell_deg = float(cell_deg)
+        self._cells = {}
+        cell_lats = np.floor(self.lats / self.cell_deg).astype(np.int64).tolist()
+        cell_lons = np.floor(self.lons / self.cell_deg).astype(np.int64).tolist()
+        for pos, cell in enumerate(zip(cell_lats, cell_lons)):
+            self._cells.setdefault(cell, []).append(pos)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def at(self, lat, lon, tolerance_deg=0.001):
+        """Row closest to a point by |dlat| + |dlon|, or None if none is within tolerance_deg"""
+        if tolerance_deg > self.cell_deg:
+            raise ValueError("tolerance_deg must not exceed the cell size")
+        lat, lon = float(lat), float(lon)
+        cell_lat, cell_lon = self._cell(lat, lon)
+        best, best_distance = None, tolerance_deg
+        for dlat in (-1, 0, 1):
+            for dlon in (-1, 0, 1):
+                for pos in self._cells.get((cell_lat + dlat, cell_lon + dlon), ()):
+                    distance = abs(self.lats[pos] - lat) + abs(self.lons[pos] - lon)
+                    if distance < best_distance:
+                        best, best_distance = pos, distance
+        return None if best is None else self.rows[best]
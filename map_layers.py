@@ -0,0 +1,403 @@
+"""
+Shop layer rendering for the Walmart Risk Detection map
+
+Shops are either drawn as one folium.Marker each (full popups, fine for a few
+hundred shops), emitted as a single GeoJSON FeatureCollection that the browser
+styles and templates itself, or handed to the browser as one data array that
+Leaflet.markercluster turns into clusters client-side. The last two keep Python
+work to a single serialization and page weight flat as the network grows.
+
+Each layer is split into a prepare step (prepare_shop_layer: plain, immutable
+data that can be cached and shared between sessions) and a cheap draw step.
+
+The map is sent to the browser in two parts: build_base_map is the static map,
+which is identical on every rerun for the same center and style so the browser
+keeps it mounted (with its zoom and pan). Its markers for the other centers are
+one pre-serialized GeoJSON layer (prepare_center_layer), so rebuilding and
+rendering it costs the same however many centers there are. build_shop_layer and
+build_selection_layer return feature groups that are swapped into the mounted
+map whenever the visible shops or the selection change.
+"""
+
+import json
+import re
+
+import folium
+from branca.element import MacroElement
+from folium import plugins
+from folium.elements import JSCSSMixin
+from jinja2 import Template
+from jinja2.utils import htmlsafe_json_dumps
+
+# Enhanced risk color and icon mapping
+RISK_CONFIG = {
+    "high": {"color": "red", "icon": "exclamation-triangle", "emoji": "🔴"},
+    "medium": {"color": "orange", "icon": "exclamation-circle", "emoji": "🟡"},
+    "low": {"color": "green", "icon": "check-circle", "emoji": "🟢"}
+}
+UNKNOWN_RISK = {"color": "gray", "icon": "question", "emoji": "⚪"}
+
+# Shop markers put their id in the tooltip, the text st_folium returns for a clicked object
+SHOP_TOOLTIP_ID = re.compile(r"Shop #(\d+)")
+
+# Builds one risk-styled marker with tooltip and popup in the browser (used by the
+# clustered and GeoJSON layers, so styling and popup templating happen client-side)
+_SHOP_MARKER_FUNCTION = """
+function (lat, lon, id, name, risk, preview) {
+    var config = %(risk_config)s[risk] || %(unknown_risk)s;
+    var icon = L.AwesomeMarkers.icon({markerColor: config.color, icon: config.icon, prefix: 'fa'});
+    var marker = L.marker(new L.LatLng(lat, lon), {icon: icon, risk: risk, shopId: id});
+    marker.bindTooltip(config.emoji + ' ' + name + ' (Risk: ' + risk + ', Shop #' + id + ') - Click for analysis');
+    marker.bindPopup(
+        "<div style='font-family: Arial; width: 250px;'>" +
+        "<h4 style='color: " + config.color + "; margin: 0;'>" + config.emoji + " " + name + "</h4>" +
+        "<hr style='margin: 5px 0;'>" +
+        "<p><b>Shop ID:</b> " + id + "</p>" +
+        "<p><b>Risk Level:</b> <span style='color: " + config.color + "; font-weight: bold;'>" +
+        risk.toUpperCase() + "</span></p>" +
+        "<p><b>Location:</b> " + lat.toFixed(4) + ", " + lon.toFixed(4) + "</p>" +
+        "<div style='background-color: #f0f0f0; padding: 8px; border-radius: 5px; margin-top: 8px;'>" +
+        "<b>Analysis Preview:</b><br><small>" + preview + "</small></div></div>",
+        {maxWidth: 300}
+    );
+    return marker;
+}
+"""
+
+
+def _shop_marker_js():
+    return _SHOP_MARKER_FUNCTION % {
+        "risk_config": json.dumps(RISK_CONFIG, ensure_ascii=False),
+        "unknown_risk": json.dumps(UNKNOWN_RISK, ensure_ascii=False),
+    }
+
+
+class ShopGeoJsonLayer(MacroElement):
+    """All shops as one GeoJSON FeatureCollection, turned into markers by Leaflet in the browser"""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function () {
+            var makeMarker = {{ this.marker_function }};
+            return L.geoJSON({{ this.data }}, {
+                pointToLayer: function (feature, latlng) {
+                    var p = feature.properties;
+                    return makeMarker(latlng.lat, latlng.lng, feature.id, p.name, p.risk, p.preview);
+                }
+            }).addTo({{ this._parent.get_name() }});
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, feature_collection):
+        super().__init__()
+        self._name = "ShopGeoJsonLayer"
+        # Accepts the serialized collection from prepare_shop_layer so it is only encoded once
+        if not isinstance(feature_collection, str):
+            feature_collection = htmlsafe_json_dumps(feature_collection)
+        self.data = feature_collection
+        self.marker_function = _shop_marker_js()
+
+
+# Marker for one of the other (not focused) centers, built in the browser from a GeoJSON feature
+_CENTER_MARKER_FUNCTION = """
+function (feature, latlng) {
+    var name = feature.properties.name;
+    var icon = L.AwesomeMarkers.icon({markerColor: 'lightblue', icon: 'shopping-cart', prefix: 'fa'});
+    var marker = L.marker(latlng, {icon: icon});
+    marker.bindTooltip('🏪 ' + name);
+    marker.bindPopup('<b>' + name + '</b><br>Center ID: ' + feature.id);
+    return marker;
+}
+"""
+
+
+class CenterGeoJsonLayer(MacroElement):
+    """Center markers from one serialized GeoJSON FeatureCollection, created by Leaflet in the browser"""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = L.geoJSON({{ this.data }}, {
+            pointToLayer: {{ this.marker_function }}
+        }).addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, feature_collection):
+        super().__init__()
+        self._name = "CenterGeoJsonLayer"
+        self.data = feature_collection
+        self.marker_function = _CENTER_MARKER_FUNCTION
+
+
+class MarkerClusterAssets(JSCSSMixin, MacroElement):
+    """Loads the Leaflet.markercluster plugin without drawing anything"""
+
+    default_js = plugins.MarkerCluster.default_js
+    default_css = plugins.MarkerCluster.default_css
+
+    def __init__(self):
+        super().__init__()
+        self._name = "MarkerClusterAssets"
+
+
+# Cluster badge: shop count plus high/medium/low mix, colored by the high-risk share
+_CLUSTER_ICON_FUNCTION = """
+function (cluster) {
+    var counts = {high: 0, medium: 0, low: 0};
+    cluster.getAllChildMarkers().forEach(function (marker) {
+        if (marker.options.risk in counts) { counts[marker.options.risk] += 1; }
+    });
+    var total = cluster.getChildCount();
+    var highShare = counts.high / total;
+    var color = highShare > 0.3 ? '#d9534f' : (highShare > 0.15 ? '#f0ad4e' : '#5cb85c');
+    var html = "<div style='background-color: " + color + "; color: white; border-radius: 20px; " +
+        "border: 2px solid white; box-shadow: 0 2px 6px rgba(0,0,0,0.4); text-align: center; " +
+        "font-family: Arial; line-height: 1.1; padding: 4px 0;'>" +
+        "<b>" + total + "</b><br><span style='font-size: 10px;'>" +
+        counts.high + " / " + counts.medium + " / " + counts.low + "</span></div>";
+    return L.divIcon({html: html, className: 'risk-cluster', iconSize: L.point(64, 36)});
+}
+"""
+
+
+def add_shop_markers(m, shops):
+    """Add one marker with a detailed popup per (id, name, lat, lon, risk, preview) shop row"""
+    for shop_id, shop_name, shop_lat, shop_lon, risk, analysis_preview in shops:
+        # Convert coordinates to float to avoid decimal type issues
+        shop_lat_float = float(shop_lat)
+        shop_lon_float = float(shop_lon)
+        config = RISK_CONFIG.get(risk.lower(), UNKNOWN_RISK)
+
+        # Create detailed popup with click detection
+        shop_popup = f"""
+        <div style='font-family: Arial; width: 250px;' data-shop-id='{shop_id}'>
+            <h4 style='color: {config["color"]}; margin: 0;'>{config["emoji"]} {shop_name}</h4>
+            <hr style='margin: 5px 0;'>
+            <p><b>Shop ID:</b> {shop_id}</p>
+            <p><b>Risk Level:</b> <span style='color: {config["color"]}; font-weight: bold;'>{risk.upper()}</span></p>
+            <p><b>Location:</b> {shop_lat_float:.4f}, {shop_lon_float:.4f}</p>
+            <div style='background-color: #f0f0f0; padding: 8px; border-radius: 5px; margin-top: 8px;'>
+                <b>Analysis Preview:</b><br>
+                <small>{analysis_preview}</small>
+            </div>
+            <p style='font-size: 11px; color: #666; margin-top: 8px;'>🔍 Click marker to show paths to all centers</p>
+        </div>
+        """
+
+        folium.Marker(
+            [shop_lat_float, shop_lon_float],
+            tooltip=f"{config['emoji']} {shop_name} (Risk: {risk}, Shop #{shop_id}) - Click for analysis",
+            popup=folium.Popup(shop_popup, max_width=300),
+            icon=folium.Icon(
+                color=config["color"],
+                icon=config["icon"],
+                prefix="fa"
+            )
+        ).add_to(m)
+
+
+def shop_id_from_tooltip(tooltip):
+    """Shop id carried in a clicked marker's tooltip text, or None for other objects"""
+    match = SHOP_TOOLTIP_ID.search(tooltip or "")
+    return int(match.group(1)) if match else None
+
+
+def shops_to_cluster_rows(shops):
+    """(lat, lon, id, name, risk, preview) cluster rows for (id, name, lat, lon, risk, preview) shop rows"""
+    return tuple(
+        (float(lat), float(lon), shop_id, name, risk.lower(), preview)
+        for shop_id, name, lat, lon, risk, preview in shops
+    )
+
+
+def add_shop_clusters(m, rows):
+    """Add shop rows from shops_to_cluster_rows as one client-side clustered layer with risk-mix badges"""
+    callback = f"function (row) {{ return ({_shop_marker_js()})(row[0], row[1], row[2], row[3], row[4], row[5]); }}"
+    plugins.FastMarkerCluster(
+        rows,
+        callback=callback,
+        icon_create_function=_CLUSTER_ICON_FUNCTION,
+        name="Shops",
+        control=False,
+    ).add_to(m)
+
+
+def shops_to_geojson(shops):
+    """Compact FeatureCollection for (id, name, lat, lon, risk, preview) shop rows"""
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "id": shop_id,
+                "geometry": {"type": "Point", "coordinates": [round(float(lon), 6), round(float(lat), 6)]},
+                "properties": {"name": name, "risk": risk.lower(), "preview": preview},
+            }
+            for shop_id, name, lat, lon, risk, preview in shops
+        ],
+    }
+
+
+def shops_to_geojson_string(shops):
+    """shops_to_geojson serialized once, safe to embed in the page script"""
+    return str(htmlsafe_json_dumps(shops_to_geojson(shops)))
+
+
+def add_shop_geojson(m, geojson):
+    """Add a serialized FeatureCollection from shops_to_geojson_string as one client-side styled layer"""
+    ShopGeoJsonLayer(geojson).add_to(m)
+
+
+# Map tiles configuration
+TILE_MAPPING = {
+    "OpenStreetMap": "OpenStreetMap",
+    "CartoDB Positron": "CartoDB positron",
+    "CartoDB Dark_Matter": "CartoDB dark_matter"
+}
+
+# Marker mode -> (prepare shop rows into cacheable layer data, draw that data onto a map)
+SHOP_LAYERS = {
+    "Clustered": (shops_to_cluster_rows, add_shop_clusters),
+    "GeoJSON": (shops_to_geojson_string, add_shop_geojson),
+    "Individual": (tuple, add_shop_markers),
+}
+
+
+def prepare_shop_layer(marker_mode, shops):
+    """Immutable layer data for a marker mode; cache it and pass it to build_shop_layer"""
+    prepare, _ = SHOP_LAYERS.get(marker_mode, SHOP_LAYERS["Individual"])
+    return prepare(shops)
+
+
+def prepare_center_layer(all_centers, focused_center_id):
+    """Serialized FeatureCollection of every center except the focused one; cache it and pass it to build_base_map"""
+    return str(htmlsafe_json_dumps({
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "id": other_id,
+                "geometry": {"type": "Point", "coordinates": [round(float(lon), 6), round(float(lat), 6)]},
+                "properties": {"name": name},
+            }
+            for other_id, name, lat, lon in all_centers
+            if other_id != int(focused_center_id)  # the focused center gets its own marker
+        ],
+    }))
+
+
+def build_base_map(center, map_style, zoom, center_layer, coverage_radius_km):
+    """Static part of the map: tiles, styling, center markers, coverage circle and controls.
+
+    ``center_layer`` is the prepare_center_layer output for this center (center rows are
+    prepared on the fly). Only depends on its arguments (the view starts on the focused
+    center), so rebuilding it produces the same script and the mounted map is reused. Shops
+    and the selected path are drawn by build_shop_layer and build_selection_layer.
+    """
+    center_id, center_name, center_lat, center_lon = center
+
+    # Create the map with enhanced styling
+    m = folium.Map(
+        location=[float(center_lat), float(center_lon)],
+        zoom_start=zoom,
+        tiles=TILE_MAPPING[map_style]
+    )
+
+    # Add custom CSS for better styling
+    m.get_root().html.add_child(folium.Element("""
+    <style>
+    .leaflet-popup-content-wrapper {
+        border-radius: 10px;
+        box-shadow: 0 4px 8px rgba(0,0,0,0.3);
+    }
+    .leaflet-popup-content {
+        font-family: 'Arial', sans-serif;
+        line-height: 1.4;
+    }
+    </style>
+    """))
+
+    # Add Walmart center marker with custom styling
+    walmart_popup = f"""
+    <div style='font-family: Arial; width: 200px;'>
+        <h4 style='color: #0071ce; margin: 0;'>🏪 {center_name}</h4>
+        <hr style='margin: 5px 0;'>
+        <p><b>Center ID:</b> {center_id}</p>
+        <p><b>Type:</b> Walmart Center</p>
+        <p><b>Status:</b> <span style='color: green;'>Active</span></p>
+    </div>
+    """
+
+    folium.Marker(
+        [center_lat, center_lon],
+        tooltip=f"🏪 Walmart Center: {center_name}",
+        popup=folium.Popup(walmart_popup, max_width=250),
+        icon=folium.Icon(
+            color="blue",
+            icon="shopping-cart",
+            prefix="fa"
+        )
+    ).add_to(m)
+
+    # Add all other Walmart centers as smaller markers, in one client-side layer
+    if not isinstance(center_layer, str):
+        center_layer = prepare_center_layer(center_layer, center_id)
+    CenterGeoJsonLayer(center_layer).add_to(m)
+
+    # Add a circle around the Walmart center to show coverage area
+    folium.Circle(
+        location=[center_lat, center_lon],
+        radius=coverage_radius_km * 1000,
+        popup=f"Coverage Area ({coverage_radius_km:g}km radius)",
+        color="#0071ce",
+        fill=True,
+        opacity=0.3,
+        fillOpacity=0.1
+    ).add_to(m)
+
+    # Add plugins for better functionality
+    plugins.Fullscreen().add_to(m)
+    plugins.MeasureControl().add_to(m)
+    # Shop layers are swapped into the mounted map, so every marker mode's plugin loads with it
+    MarkerClusterAssets().add_to(m)
+    return m
+
+
+def build_shop_layer(marker_mode, shop_layer):
+    """Dynamic layer with the shop markers, drawn from prepare_shop_layer output for the same mode"""
+    layer = folium.FeatureGroup(name="Shops", control=False)
+    # One GeoJSON layer, client-side clusters or individual markers
+    _, draw = SHOP_LAYERS.get(marker_mode, SHOP_LAYERS["Individual"])
+    draw(layer, shop_layer)
+    return layer
+
+
+def build_selection_layer(shop, nearest_center, distance_km):
+    """Dynamic layer with the purple path from the selected shop to its nearest center"""
+    shop_lat, shop_lon = float(shop[2]), float(shop[3])
+    _, center_name, center_lat, center_lon = nearest_center
+    layer = folium.FeatureGroup(name="Selected Shop Path")
+
+    # Draw line only to nearest center with distance on the path
+    folium.PolyLine(
+        locations=[[shop_lat, shop_lon], [center_lat, center_lon]],
+        color='purple',
+        weight=4,
+        opacity=0.8,
+        popup=f"<b>📍 Distance: {distance_km:.2f} km</b><br>From: {shop[1]}<br>To: {center_name}",
+        tooltip=f"Distance: {distance_km:.2f} km"
+    ).add_to(layer)
+
+    # Add a marker at the midpoint showing distance
+    folium.Marker(
+        [(shop_lat + center_lat) / 2, (shop_lon + center_lon) / 2],
+        popup=f"<b>📏 {distance_km:.2f} km</b>",
+        tooltip=f"{distance_km:.2f} km",
+        icon=folium.DivIcon(
+            html=f'<div style="background-color: purple; color: white; padding: 2px 6px; border-radius: 3px; font-size: 12px; font-weight: bold;">{distance_km:.2f} km</div>',
+            icon_size=(80, 20),
+            icon_anchor=(40, 10)
+        )
+    ).add_to(layer)
+    return layer
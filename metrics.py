@@ -0,0 +1,242 @@
+"""
+Timing and query instrumentation for the Walmart Risk Detection app
+
+Timing spans (``with span(...)`` / ``@timed()``) and database query records are
+collected per rerun into a RerunTrace for the thread running the script, and
+aggregated process-wide. Traces can be appended as JSON lines, and the
+process totals can be exported in the Prometheus text format, so production
+sessions can be profiled without attaching a profiler.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+# Rows sampled when estimating the payload size of a query result
+BYTES_SAMPLE_ROWS = 100
+
+_local = threading.local()
+_lock = threading.Lock()
+_span_totals = defaultdict(lambda: [0, 0.0])  # name -> [count, seconds]
+_query_totals = defaultdict(lambda: [0, 0, 0, 0.0])  # call -> [queries, rows, bytes, seconds]
+_rerun_totals = {"count": 0, "seconds": 0.0, "interrupted": 0}
+
+
+class RerunTrace:
+    """Spans and queries recorded during one script run"""
+
+    def __init__(self, session=None):
+        self.session = session
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.spans = []  # (name, depth, offset seconds, duration seconds) in completion order
+        self.queries = []  # (call, rows, bytes, seconds)
+        self.duration = None
+        self.status = "running"
+
+    def query_totals(self):
+        """(queries, rows, bytes, seconds) summed over this rerun"""
+        return (
+            len(self.queries),
+            sum(q[1] for q in self.queries),
+            sum(q[2] for q in self.queries),
+            sum(q[3] for q in self.queries),
+        )
+
+    def to_dict(self):
+        queries, rows, nbytes, seconds = self.query_totals()
+        return {
+            "session": self.session,
+            "started_at": round(self.started_at, 3),
+            "status": self.status,
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+            "queries": queries,
+            "rows": rows,
+            "bytes": nbytes,
+            "query_ms": round(seconds * 1000, 3),
+            "spans": [
+                {"name": name, "depth": depth, "offset_ms": round(offset * 1000, 3), "ms": round(duration * 1000, 3)}
+                for name, depth, offset, duration in sorted(self.spans, key=lambda s: s[2])
+            ],
+            "calls": [
+                {"call": call, "rows": rows, "bytes": nbytes, "ms": round(seconds * 1000, 3)}
+                for call, rows, nbytes, seconds in self.queries
+            ],
+        }
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def current_trace():
+    """Trace of the rerun running on this thread, or None"""
+    return getattr(_local, "trace", None)
+
+
+@contextmanager
+def span(name):
+    """Time a block as a named span of the current rerun (and the process totals)"""
+    stack = _stack()
+    stack.append(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        stack.pop()
+        trace = current_trace()
+        if trace is not None:
+            trace.spans.append((name, len(stack), start - trace._start, duration))
+        with _lock:
+            totals = _span_totals[name]
+            totals[0] += 1
+            totals[1] += duration
+
+
+def timed(name=None):
+    """Decorator timing every call of a function as a span (default name: module.function)"""
+    def decorator(fn):
+        span_name = name or f"{fn.__module__}.{fn.__name__}"
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bind(fn):
+    """Wrap fn so that, run on another thread, its spans and queries count towards the caller's rerun and span"""
+    trace, stack = current_trace(), list(_stack())
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_local, "trace", None), getattr(_local, "stack", None)
+        _local.trace, _local.stack = trace, list(stack)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.trace, _local.stack = previous
+    return wrapper
+
+
+def estimate_bytes(rows):
+    """Approximate payload size of query rows, extrapolated from a sample of them"""
+    if rows is None:
+        return 0
+    if isinstance(rows, tuple):  # a single row
+        rows = [rows]
+    if not rows:
+        return 0
+    sample = rows[:BYTES_SAMPLE_ROWS]
+    sampled = sum(len(str(value)) for row in sample for value in row)
+    return int(sampled * len(rows) / len(sample))
+
+
+def record_query(rows, nbytes, seconds, call=None):
+    """Record one executed query, attributed to ``call`` or else the innermost open span"""
+    stack = _stack()
+    call = call or (stack[-1] if stack else "unattributed")
+    trace = current_trace()
+    if trace is not None:
+        trace.queries.append((call, rows, nbytes, seconds))
+    with _lock:
+        totals = _query_totals[call]
+        totals[0] += 1
+        totals[1] += rows
+        totals[2] += nbytes
+        totals[3] += seconds
+
+
+def begin_rerun(session=None):
+    """Start collecting a new trace for the script run on this thread"""
+    _local.trace = RerunTrace(session)
+    _local.stack = []
+    return _local.trace
+
+
+def finish_rerun(trace, status="ok", jsonl_path=None, prometheus_path=None):
+    """Close a trace (once), add it to the process totals and export it; returns the trace"""
+    if trace.duration is not None:
+        return trace
+    trace.duration = time.perf_counter() - trace._start
+    trace.status = status
+    if current_trace() is trace:
+        _local.trace = None
+    with _lock:
+        _rerun_totals["count"] += 1
+        _rerun_totals["seconds"] += trace.duration
+        if status != "ok":
+            _rerun_totals["interrupted"] += 1
+        if jsonl_path:
+            with open(jsonl_path, "a") as f:
+                f.write(json.dumps(trace.to_dict()) + "\n")
+    if prometheus_path:
+        write_prometheus(prometheus_path)
+    return trace
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text():
+    """Process totals in the Prometheus text exposition format"""
+    with _lock:
+        spans = {name: list(totals) for name, totals in _span_totals.items()}
+        queries = {call: list(totals) for call, totals in _query_totals.items()}
+        reruns = dict(_rerun_totals)
+
+    lines = [
+        "# HELP walmart_reruns_total Script reruns finished (including interrupted ones).",
+        "# TYPE walmart_reruns_total counter",
+        f"walmart_reruns_total {reruns['count']}",
+        "# HELP walmart_reruns_interrupted_total Reruns cut short by st.rerun() or st.stop().",
+        "# TYPE walmart_reruns_interrupted_total counter",
+        f"walmart_reruns_interrupted_total {reruns['interrupted']}",
+        "# HELP walmart_rerun_seconds Wall time of script reruns.",
+        "# TYPE walmart_rerun_seconds summary",
+        f"walmart_rerun_seconds_sum {reruns['seconds']:.6f}",
+        f"walmart_rerun_seconds_count {reruns['count']}",
+        "# HELP walmart_span_seconds Wall time of instrumented spans.",
+        "# TYPE walmart_span_seconds summary",
+    ]
+    for name, (count, seconds) in sorted(spans.items()):
+        lines.append(f'walmart_span_seconds_sum{{span="{_label(name)}"}} {seconds:.6f}')
+        lines.append(f'walmart_span_seconds_count{{span="{_label(name)}"}} {count}')
+    for metric, index, kind, help_text in (
+        ("walmart_db_queries_total", 0, "counter", "Database queries executed."),
+        ("walmart_db_rows_total", 1, "counter", "Rows returned by database queries."),
+        ("walmart_db_bytes_total", 2, "counter", "Estimated payload bytes returned by database queries."),
+        ("walmart_db_query_seconds_total", 3, "counter", "Time spent executing and fetching database queries."),
+    ):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for call, totals in sorted(queries.items()):
+            value = f"{totals[index]:.6f}" if index == 3 else str(totals[index])
+            lines.append(f'{metric}{{call="{_label(call)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    """Write the process totals to a file (e.g. for the node_exporter textfile collector)"""
+    # A temporary file of its own per call, so concurrent reruns never rename each other's
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp",
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(prometheus_text())
+        os.chmod(tmp_path, 0o644)  # mkstemp creates owner-only files; collectors may run as another user
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
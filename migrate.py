@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Schema migrations for Walmart Risk Detection System
+Brings an existing SQLite or PostgreSQL database up to the current schema and
+records every applied version in the schema_version table. Safe to run
+repeatedly: only migrations newer than the recorded version are applied.
+"""
+
+import argparse
+
+from db import adapt_placeholders, connect_db, is_sqlite
+from geo import GEOHASH_ALPHABET, GEOHASH_PRECISION, geohash_bits
+
+SCHEMA_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_shops_risk ON shops (risk)",
+    "CREATE INDEX IF NOT EXISTS idx_shops_lat_lon ON shops (lat, lon)",
+    "CREATE INDEX IF NOT EXISTS idx_shops_risk_lat_lon ON shops (risk, lat, lon)",
+    "CREATE INDEX IF NOT EXISTS idx_centers_lat_lon ON centers (lat, lon)",
+]
+
+
+def geohash_sql(lat, lon, dialect, precision=GEOHASH_PRECISION):
+    """SQL expression computing the same key as geo.geohash_encode from two coordinate expressions"""
+    lon_bits, lat_bits = geohash_bits(precision)
+
+    def quantized(value, offset, span, nbits):
+        scaled = f"(({value} + {offset}) / {span} * {float(1 << nbits)})"
+        if dialect == "sqlite":
+            return f"min(max(CAST({scaled} AS INTEGER), 0), {(1 << nbits) - 1})"  # values are >= 0, CAST truncates
+        return f"LEAST(GREATEST(CAST(floor({scaled}) AS BIGINT), 0), {(1 << nbits) - 1})"
+
+    lon_q = quantized(lon, 180.0, 360.0, lon_bits)
+    lat_q = quantized(lat, 90.0, 180.0, lat_bits)
+    chars = []
+    for char in range(precision):
+        terms = []
+        for i in range(5 * char, 5 * char + 5):
+            q, nbits = (lon_q, lon_bits) if i % 2 == 0 else (lat_q, lat_bits)
+            terms.append(f"((({q}) >> {nbits - 1 - i // 2}) & 1) * {1 << (4 - i % 5)}")
+        chars.append(f"substr('{GEOHASH_ALPHABET}', CAST(1 + {' + '.join(terms)} AS INTEGER), 1)")
+    return " || ".join(chars)
+
+
+def _geohash_postgresql():
+    statements = [
+        f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS geohash VARCHAR({GEOHASH_PRECISION}) COLLATE "C"'
+        for table in ("centers", "shops")
+    ]
+    statements.append(f"""
+CREATE OR REPLACE FUNCTION geohash_encode(lat DOUBLE PRECISION, lon DOUBLE PRECISION) RETURNS TEXT AS $$
+    SELECT {geohash_sql("lat", "lon", "postgresql")}
+$$ LANGUAGE sql IMMUTABLE""")
+    statements.append("""
+CREATE OR REPLACE FUNCTION set_geohash() RETURNS trigger AS $$
+BEGIN
+    NEW.geohash := geohash_encode(NEW.lat, NEW.lon);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql""")
+    for table in ("centers", "shops"):
+        statements += [
+            f"DROP TRIGGER IF EXISTS {table}_set_geohash ON {table}",
+            f"CREATE TRIGGER {table}_set_geohash BEFORE INSERT OR UPDATE OF lat, lon ON {table} "
+            "FOR EACH ROW EXECUTE FUNCTION set_geohash()",
+            f"UPDATE {table} SET geohash = geohash_encode(lat, lon)",
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_geohash ON {table} (geohash)",
+        ]
+    return statements
+
+
+def _geohash_sqlite():
+    statements = []
+    for table in ("centers", "shops"):
+        from_new = geohash_sql("NEW.lat", "NEW.lon", "sqlite")
+        statements += [
+            f"ALTER TABLE {table} ADD COLUMN geohash TEXT",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_geohash_insert AFTER INSERT ON {table} BEGIN "
+            f"UPDATE {table} SET geohash = {from_new} WHERE id = NEW.id; END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_geohash_update AFTER UPDATE OF lat, lon ON {table} BEGIN "
+            f"UPDATE {table} SET geohash = {from_new} WHERE id = NEW.id; END",
+            f"UPDATE {table} SET geohash = {geohash_sql('lat', 'lon', 'sqlite')}",
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_geohash ON {table} (geohash)",
+        ]
+    return statements
+
+
+# Columns whose changes bump a row's version (delta sync)
+VERSIONED_COLUMNS = {
+    "centers": ("name", "lat", "lon", "deleted_at"),
+    "shops": ("name", "lat", "lon", "risk", "analysis", "deleted_at"),
+}
+
+
+def _row_versions_postgresql():
+    # A row's version is the id of the transaction that wrote it, so readers can tell from the
+    # oldest still-running transaction (txid_snapshot_xmin) which versions may yet appear
+    statements = []
+    for table in VERSIONED_COLUMNS:
+        statements += [
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0",
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMPTZ",
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_version ON {table} (version)",
+        ]
+    statements.append("""
+CREATE OR REPLACE FUNCTION bump_row_version() RETURNS trigger AS $$
+BEGIN
+    NEW.version := txid_current();
+    NEW.updated_at := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql""")
+    for table in VERSIONED_COLUMNS:
+        statements += [
+            f"DROP TRIGGER IF EXISTS {table}_row_version ON {table}",
+            f"CREATE TRIGGER {table}_row_version BEFORE INSERT OR UPDATE ON {table} "
+            "FOR EACH ROW EXECUTE FUNCTION bump_row_version()",
+        ]
+    # Tell listeners what happened, so inserts/updates can be delta-synced instead of reloaded
+    statements.append("""
+CREATE OR REPLACE FUNCTION notify_data_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('walmart_data_changed', TG_TABLE_NAME || ':' || TG_OP);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql""")
+    return statements
+
+
+def _row_versions_sqlite():
+    # SQLite runs one writer at a time, so counter order is also commit order
+    statements = [
+        "CREATE TABLE IF NOT EXISTS row_version (id INTEGER PRIMARY KEY CHECK (id = 1), value INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO row_version (id, value) VALUES (1, 0)",
+    ]
+    for table, columns in VERSIONED_COLUMNS.items():
+        bump = (
+            "UPDATE row_version SET value = value + 1 WHERE id = 1; "
+            f"UPDATE {table} SET version = (SELECT value FROM row_version WHERE id = 1), "
+            "updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;"
+        )
+        statements += [
+            f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+            f"ALTER TABLE {table} ADD COLUMN updated_at TEXT",  # SQLite can't add a column defaulting to now
+            f"ALTER TABLE {table} ADD COLUMN deleted_at TEXT",
+            f"UPDATE {table} SET updated_at = CURRENT_TIMESTAMP",
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_version ON {table} (version)",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_version_insert AFTER INSERT ON {table} BEGIN {bump} END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_version_update AFTER UPDATE OF {', '.join(columns)} "
+            f"ON {table} BEGIN {bump} END",
+        ]
+    return statements
+
+
+# (version, description, PostgreSQL statements, SQLite statements), oldest first
+MIGRATIONS = [
+    (1, "Store coordinates as double precision", [
+        "ALTER TABLE centers ALTER COLUMN lat TYPE DOUBLE PRECISION, ALTER COLUMN lon TYPE DOUBLE PRECISION",
+        "ALTER TABLE shops ALTER COLUMN lat TYPE DOUBLE PRECISION, ALTER COLUMN lon TYPE DOUBLE PRECISION",
+    ], [
+        # SQLite tables already declare REAL coordinates
+    ]),
+    (2, "Index shop risk and center/shop coordinates", INDEXES, INDEXES),
+    (3, "Add indexed geohash keys to centers and shops", _geohash_postgresql(), _geohash_sqlite()),
+    (4, "Add row versions, updated_at and soft deletes for delta sync", _row_versions_postgresql(),
+     _row_versions_sqlite()),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    """Highest applied schema version (0 for a database that was never migrated)"""
+    cursor = conn.cursor()
+    cursor.execute(SCHEMA_VERSION_TABLE)
+    cursor.execute("SELECT MAX(version) FROM schema_version")
+    version = cursor.fetchone()[0]
+    cursor.close()
+    return version or 0
+
+
+def migrate(conn, target=None):
+    """Apply pending migrations up to ``target`` (default: latest); returns the versions applied.
+
+    Each migration runs in one transaction together with its schema_version row, so a failed
+    migration leaves no partial schema behind. sqlite3 runs DDL outside of its implicit
+    transactions, so on SQLite the transaction is opened explicitly.
+    """
+    current = current_version(conn)
+    conn.commit()
+    sqlite = is_sqlite(conn)
+    applied = []
+    for version, description, postgresql_statements, sqlite_statements in MIGRATIONS:
+        if version <= current or (target is not None and version > target):
+            continue
+        if sqlite:
+            isolation_level, conn.isolation_level = conn.isolation_level, None
+        cursor = conn.cursor()
+        try:
+            if sqlite:
+                cursor.execute("BEGIN")
+            for statement in sqlite_statements if sqlite else postgresql_statements:
+                cursor.execute(statement)
+            cursor.execute(
+                adapt_placeholders(conn, "INSERT INTO schema_version (version, description) VALUES (%s, %s)"),
+                (version, description)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            if sqlite:
+                conn.isolation_level = isolation_level
+        applied.append(version)
+    return applied
+
+
+def postgresql_migration_sql():
+    """All PostgreSQL migrations as one SQL script (for postgresql_setup.sql)"""
+    lines = [SCHEMA_VERSION_TABLE.strip() + ";", ""]
+    for version, description, postgresql_statements, _ in MIGRATIONS:
+        lines.append(f"-- Schema version {version}: {description}")
+        lines.extend(f"{statement};" for statement in postgresql_statements)
+        escaped_description = description.replace("'", "''")
+        lines.append(
+            f"INSERT INTO schema_version (version, description) VALUES ({version}, '{escaped_description}') "
+            "ON CONFLICT (version) DO NOTHING;"
+        )
+        lines.append("")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply schema migrations")
+    parser.add_argument("--sqlite", metavar="PATH", help="SQLite database file (default: PostgreSQL from .env)")
+    parser.add_argument("--target", type=int, help="Migrate up to this version instead of the latest")
+    parser.add_argument("--status", action="store_true", help="Only show the current schema version")
+    args = parser.parse_args()
+
+    print("🧱 Walmart Risk Detection - Schema Migrations")
+    print("=" * 55)
+
+    conn = connect_db(args.sqlite)
+    try:
+        version = current_version(conn)
+        conn.commit()
+        print(f"📋 Current schema version: {version} (latest: {SCHEMA_VERSION})")
+        if not args.status:
+            applied = migrate(conn, target=args.target)
+            for applied_version, description, _, _ in MIGRATIONS:
+                if applied_version in applied:
+                    print(f"✅ Applied {applied_version}: {description}")
+            if not applied:
+                print("✅ Schema is up to date")
+    finally:
+        conn.close()
@@ -5,16 +5,16 @@
 CREATE TABLE IF NOT EXISTS centers (
     id SERIAL PRIMARY KEY,
     name VARCHAR(255) NOT NULL,
-    lat DECIMAL(10, 6) NOT NULL,
-    lon DECIMAL(10, 6) NOT NULL
+    lat DOUBLE PRECISION NOT NULL,
+    lon DOUBLE PRECISION NOT NULL
 );
 
 -- Create shops table  
 CREATE TABLE IF NOT EXISTS shops (
     id SERIAL PRIMARY KEY,
     name VARCHAR(255) NOT NULL,
-    lat DECIMAL(10, 6) NOT NULL,
-    lon DECIMAL(10, 6) NOT NULL,
+    lat DOUBLE PRECISION NOT NULL,
+    lon DOUBLE PRECISION NOT NULL,
     risk VARCHAR(20) NOT NULL CHECK (risk IN ('low', 'medium', 'high')),
     analysis TEXT NOT NULL
 );
@@ -108,3 +108,111 @@ INSERT INTO shops (id, name, lat, lon, risk, analysis) VALUES
 -- Reset sequences
 SELECT setval('centers_id_seq', (SELECT MAX(id) FROM centers));
 SELECT setval('shops_id_seq', (SELECT MAX(id) FROM shops));
+
+-- Nearest-center assignments (populate with: python assign_centers.py)
+CREATE TABLE IF NOT EXISTS shop_nearest_center (
+    shop_id INTEGER PRIMARY KEY REFERENCES shops(id) ON DELETE CASCADE,
+    center_id INTEGER NOT NULL,
+    distance_km DOUBLE PRECISION NOT NULL,
+    shop_lat DOUBLE PRECISION NOT NULL,
+    shop_lon DOUBLE PRECISION NOT NULL,
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_shop_nearest_center_center ON shop_nearest_center (center_id);
+
+CREATE TABLE IF NOT EXISTS assigned_centers (
+    center_id INTEGER PRIMARY KEY,
+    lat DOUBLE PRECISION NOT NULL,
+    lon DOUBLE PRECISION NOT NULL
+);
+
+-- Notify running app instances so their shared data cache reloads early
+CREATE OR REPLACE FUNCTION notify_data_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('walmart_data_changed', TG_TABLE_NAME || ':' || TG_OP);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS centers_notify_change ON centers;
+CREATE TRIGGER centers_notify_change
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON centers
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_data_changed();
+
+DROP TRIGGER IF EXISTS shops_notify_change ON shops;
+CREATE TRIGGER shops_notify_change
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON shops
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_data_changed();
+
+-- Schema migrations (indexes) and version record, same as: python migrate.py
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Schema version 1: Store coordinates as double precision
+ALTER TABLE centers ALTER COLUMN lat TYPE DOUBLE PRECISION, ALTER COLUMN lon TYPE DOUBLE PRECISION;
+ALTER TABLE shops ALTER COLUMN lat TYPE DOUBLE PRECISION, ALTER COLUMN lon TYPE DOUBLE PRECISION;
+INSERT INTO schema_version (version, description) VALUES (1, 'Store coordinates as double precision') ON CONFLICT (version) DO NOTHING;
+
+-- Schema version 2: Index shop risk and center/shop coordinates
+CREATE INDEX IF NOT EXISTS idx_shops_risk ON shops (risk);
+CREATE INDEX IF NOT EXISTS idx_shops_lat_lon ON shops (lat, lon);
+CREATE INDEX IF NOT EXISTS idx_shops_risk_lat_lon ON shops (risk, lat, lon);
+CREATE INDEX IF NOT EXISTS idx_centers_lat_lon ON centers (lat, lon);
+INSERT INTO schema_version (version, description) VALUES (2, 'Index shop risk and center/shop coordinates') ON CONFLICT (version) DO NOTHING;
+
+-- Schema version 3: Add indexed geohash keys to centers and shops
+ALTER TABLE centers ADD COLUMN IF NOT EXISTS geohash VARCHAR(9) COLLATE "C";
+ALTER TABLE shops ADD COLUMN IF NOT EXISTS geohash VARCHAR(9) COLLATE "C";
+
+CREATE OR REPLACE FUNCTION geohash_encode(lat DOUBLE PRECISION, lon DOUBLE PRECISION) RETURNS TEXT AS $$
+    SELECT substr('0123456789bcdefghjkmnpqrstuvwxyz', CAST(1 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 22) & 1) * 16 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 21) & 1) * 8 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 21) & 1) * 4 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 20) & 1) * 2 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 20) & 1) * 1 AS INTEGER), 1) || substr('0123456789bcdefghjkmnpqrstuvwxyz', CAST(1 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 19) & 1) * 16 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 19) & 1) * 8 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 18) & 1) * 4 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 18) & 1) * 2 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 17) & 1) * 1 AS INTEGER), 1) || substr('0123456789bcdefghjkmnpqrstuvwxyz', CAST(1 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 17) & 1) * 16 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 16) & 1) * 8 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 16) & 1) * 4 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 15) & 1) * 2 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 15) & 1) * 1 AS INTEGER), 1) || substr('0123456789bcdefghjkmnpqrstuvwxyz', CAST(1 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 14) & 1) * 16 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 14) & 1) * 8 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 13) & 1) * 4 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 13) & 1) * 2 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 12) & 1) * 1 AS INTEGER), 1) || substr('0123456789bcdefghjkmnpqrstuvwxyz', CAST(1 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 12) & 1) * 16 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 11) & 1) * 8 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 11) & 1) * 4 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 10) & 1) * 2 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 10) & 1) * 1 AS INTEGER), 1) || substr('0123456789bcdefghjkmnpqrstuvwxyz', CAST(1 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 9) & 1) * 16 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 9) & 1) * 8 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 8) & 1) * 4 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 8) & 1) * 2 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 7) & 1) * 1 AS INTEGER), 1) || substr('0123456789bcdefghjkmnpqrstuvwxyz', CAST(1 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 7) & 1) * 16 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 6) & 1) * 8 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 6) & 1) * 4 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 5) & 1) * 2 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 5) & 1) * 1 AS INTEGER), 1) || substr('0123456789bcdefghjkmnpqrstuvwxyz', CAST(1 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 4) & 1) * 16 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 4) & 1) * 8 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 3) & 1) * 4 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 3) & 1) * 2 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 2) & 1) * 1 AS INTEGER), 1) || substr('0123456789bcdefghjkmnpqrstuvwxyz', CAST(1 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 2) & 1) * 16 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 1) & 1) * 8 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 1) & 1) * 4 + (((LEAST(GREATEST(CAST(floor(((lat + 90.0) / 180.0 * 4194304.0)) AS BIGINT), 0), 4194303)) >> 0) & 1) * 2 + (((LEAST(GREATEST(CAST(floor(((lon + 180.0) / 360.0 * 8388608.0)) AS BIGINT), 0), 8388607)) >> 0) & 1) * 1 AS INTEGER), 1)
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION set_geohash() RETURNS trigger AS $$
+BEGIN
+    NEW.geohash := geohash_encode(NEW.lat, NEW.lon);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS centers_set_geohash ON centers;
+CREATE TRIGGER centers_set_geohash BEFORE INSERT OR UPDATE OF lat, lon ON centers FOR EACH ROW EXECUTE FUNCTION set_geohash();
+UPDATE centers SET geohash = geohash_encode(lat, lon);
+CREATE INDEX IF NOT EXISTS idx_centers_geohash ON centers (geohash);
+DROP TRIGGER IF EXISTS shops_set_geohash ON shops;
+CREATE TRIGGER shops_set_geohash BEFORE INSERT OR UPDATE OF lat, lon ON shops FOR EACH ROW EXECUTE FUNCTION set_geohash();
+UPDATE shops SET geohash = geohash_encode(lat, lon);
+CREATE INDEX IF NOT EXISTS idx_shops_geohash ON shops (geohash);
+INSERT INTO schema_version (version, description) VALUES (3, 'Add indexed geohash keys to centers and shops') ON CONFLICT (version) DO NOTHING;
+
+-- Schema version 4: Add row versions, updated_at and soft deletes for delta sync
+ALTER TABLE centers ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE centers ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+ALTER TABLE centers ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMPTZ;
+CREATE INDEX IF NOT EXISTS idx_centers_version ON centers (version);
+ALTER TABLE shops ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE shops ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+ALTER TABLE shops ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMPTZ;
+CREATE INDEX IF NOT EXISTS idx_shops_version ON shops (version);
+
+CREATE OR REPLACE FUNCTION bump_row_version() RETURNS trigger AS $$
+BEGIN
+    NEW.version := txid_current();
+    NEW.updated_at := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS centers_row_version ON centers;
+CREATE TRIGGER centers_row_version BEFORE INSERT OR UPDATE ON centers FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+DROP TRIGGER IF EXISTS shops_row_version ON shops;
+CREATE TRIGGER shops_row_version BEFORE INSERT OR UPDATE ON shops FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE OR REPLACE FUNCTION notify_data_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('walmart_data_changed', TG_TABLE_NAME || ':' || TG_OP);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+INSERT INTO schema_version (version, description) VALUES (4, 'Add row versions, updated_at and soft deletes for delta sync') ON CONFLICT (version) DO NOTHING;
@@ -7,6 +7,9 @@ Creates sample data for hackathon demo
 import sqlite3
 import os
 
+from assign_centers import assign_nearest_centers
+from migrate import migrate, postgresql_migration_sql
+
 def create_sqlite_database():
     """Create SQLite database with sample data"""
     db_path = "walmart_risk.db"
@@ -321,7 +324,13 @@ def create_sqlite_database():
     
     cursor.executemany("INSERT INTO shops (id, name, lat, lon, risk, analysis) VALUES (?, ?, ?, ?, ?, ?)", shops_data)
     
+    # Precompute each shop's nearest center
+    assign_nearest_centers(conn, full=True)
+    
     conn.commit()
+    
+    # Indexes and schema version
+    migrate(conn)
     conn.close()
     
     print("✅ SQLite database created successfully!")
@@ -395,16 +404,16 @@ def create_postgresql_setup():
 CREATE TABLE IF NOT EXISTS centers (
     id SERIAL PRIMARY KEY,
     name VARCHAR(255) NOT NULL,
-    lat DECIMAL(10, 6) NOT NULL,
-    lon DECIMAL(10, 6) NOT NULL
+    lat DOUBLE PRECISION NOT NULL,
+    lon DOUBLE PRECISION NOT NULL
 );
 
 -- Create shops table  
 CREATE TABLE IF NOT EXISTS shops (
     id SERIAL PRIMARY KEY,
     name VARCHAR(255) NOT NULL,
-    lat DECIMAL(10, 6) NOT NULL,
-    lon DECIMAL(10, 6) NOT NULL,
+    lat DOUBLE PRECISION NOT NULL,
+    lon DOUBLE PRECISION NOT NULL,
     risk VARCHAR(20) NOT NULL CHECK (risk IN ('low', 'medium', 'high')),
     analysis TEXT NOT NULL
 );
@@ -473,7 +482,44 @@ INSERT INTO shops (id, name, lat, lon, risk, analysis) VALUES
     sql_content += """-- Reset sequences
 SELECT setval('centers_id_seq', (SELECT MAX(id) FROM centers));
 SELECT setval('shops_id_seq', (SELECT MAX(id) FROM shops));
-"""
+
+-- Nearest-center assignments (populate with: python assign_centers.py)
+CREATE TABLE IF NOT EXISTS shop_nearest_center (
+    shop_id INTEGER PRIMARY KEY REFERENCES shops(id) ON DELETE CASCADE,
+    center_id INTEGER NOT NULL,
+    distance_km DOUBLE PRECISION NOT NULL,
+    shop_lat DOUBLE PRECISION NOT NULL,
+    shop_lon DOUBLE PRECISION NOT NULL,
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_shop_nearest_center_center ON shop_nearest_center (center_id);
+
+CREATE TABLE IF NOT EXISTS assigned_centers (
+    center_id INTEGER PRIMARY KEY,
+    lat DOUBLE PRECISION NOT NULL,
+    lon DOUBLE PRECISION NOT NULL
+);
+
+-- Notify running app instances so their shared data cache reloads early
+CREATE OR REPLACE FUNCTION notify_data_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('walmart_data_changed', TG_TABLE_NAME || ':' || TG_OP);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS centers_notify_change ON centers;
+CREATE TRIGGER centers_notify_change
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON centers
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_data_changed();
+
+DROP TRIGGER IF EXISTS shops_notify_change ON shops;
+CREATE TRIGGER shops_notify_change
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON shops
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_data_changed();
+
+-- Schema migrations (indexes) and version record, same as: python migrate.py
+""" + postgresql_migration_sql()
     
     # Write to file
     with open("postgresql_setup.sql", "w", encoding='utf-8') as f:
@@ -498,3 +544,4 @@ if __name__ == "__main__":
     print("\n🎯 Next Steps:")
     print("1. For immediate testing: Use SQLite (already created)")
     print("2. For PostgreSQL: Run the postgresql_setup.sql file in your PostgreSQL database")
+    print("   then python assign_centers.py to precompute nearest centers")
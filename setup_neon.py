@@ -8,6 +8,10 @@ import psycopg2
 import os
 from dotenv import load_dotenv
 
+from assign_centers import assign_nearest_centers
+from bulk_load import replace_tables, report
+from migrate import migrate
+
 load_dotenv()
 
 def setup_neon_database():
@@ -25,32 +29,49 @@ def setup_neon_database():
         
         cursor = conn.cursor()
         
-        # Drop existing tables if they exist (for fresh setup)
-        cursor.execute("DROP TABLE IF EXISTS shops CASCADE")
-        cursor.execute("DROP TABLE IF EXISTS centers CASCADE")
-        
-        # Create centers table
+        # Create tables if they don't exist yet; existing data is replaced atomically below
         cursor.execute("""
-        CREATE TABLE centers (
+        CREATE TABLE IF NOT EXISTS centers (
             id SERIAL PRIMARY KEY,
             name VARCHAR(255) NOT NULL,
-            lat DECIMAL(10, 6) NOT NULL,
-            lon DECIMAL(10, 6) NOT NULL
+            lat DOUBLE PRECISION NOT NULL,
+            lon DOUBLE PRECISION NOT NULL
         )
         """)
         
         # Create shops table
         cursor.execute("""
-        CREATE TABLE shops (
+        CREATE TABLE IF NOT EXISTS shops (
             id SERIAL PRIMARY KEY,
             name VARCHAR(255) NOT NULL,
-            lat DECIMAL(10, 6) NOT NULL,
-            lon DECIMAL(10, 6) NOT NULL,
+            lat DOUBLE PRECISION NOT NULL,
+            lon DOUBLE PRECISION NOT NULL,
             risk VARCHAR(20) NOT NULL CHECK (risk IN ('low', 'medium', 'high')),
             analysis TEXT NOT NULL
         )
         """)
         
+        # Notify running app instances so their shared data cache reloads early
+        cursor.execute("""
+        CREATE OR REPLACE FUNCTION notify_data_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('walmart_data_changed', TG_TABLE_NAME || ':' || TG_OP);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """)
+        for table in ("centers", "shops"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {table}_notify_change ON {table}")
+            cursor.execute(f"""
+            CREATE TRIGGER {table}_notify_change
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_data_changed()
+            """)
+        
+        conn.commit()
+        
+        # Indexes, geohash keys and schema version (before loading, so the geohash triggers fill new rows)
+        migrate(conn)
         print("✅ Tables created successfully!")
         
         # Insert 50 Walmart centers across major US cities
@@ -107,13 +128,6 @@ def setup_neon_database():
             (50, "Walmart Supercenter Orlando", 28.5383, -81.3792)
         ]
         
-        cursor.executemany(
-            "INSERT INTO centers (id, name, lat, lon) VALUES (%s, %s, %s, %s)",
-            centers_data
-        )
-        
-        print("✅ Walmart centers data inserted!")
-        
         # Insert suppliers for first 3 Walmart centers (30 shops total for demo)
         shops_data = [
             # Dallas Center Suppliers (IDs 1-10)
@@ -183,17 +197,24 @@ def setup_neon_database():
              "Construction supply company with moderate risk factors. Good local contractor relationships but inventory turnover concerns. Seasonal demand management needed.")
         ]
         
-        cursor.executemany(
-            "INSERT INTO shops (id, name, lat, lon, risk, analysis) VALUES (%s, %s, %s, %s, %s, %s)",
-            shops_data
-        )
-        
-        print("✅ Shops data inserted!")
+        # Stream both tables into staging tables and swap them in within one transaction
+        method, stats = replace_tables(conn, [
+            ("centers", ("id", "name", "lat", "lon"), lambda: centers_data),
+            ("shops", ("id", "name", "lat", "lon", "risk", "analysis"), lambda: shops_data),
+        ])
+        print("✅ Walmart centers and shops data loaded!")
+        report(method, stats)
         
         # Reset sequences to match inserted IDs
+        cursor = conn.cursor()
         cursor.execute("SELECT setval('centers_id_seq', (SELECT MAX(id) FROM centers))")
         cursor.execute("SELECT setval('shops_id_seq', (SELECT MAX(id) FROM shops))")
         
+        # Precompute each shop's nearest center
+        assign_nearest_centers(conn, full=True)
+        print("✅ Nearest centers assigned!")
+        
+        # Publish the new data (and its assignments) atomically
         conn.commit()
         cursor.close()
         conn.close()
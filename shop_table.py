@@ -0,0 +1,129 @@
+"""
+Columnar in-memory shop table for the Walmart Risk Detection app
+
+Stores shop listing rows as NumPy columns (int64 ids, float64 coordinates,
+int8 risk codes) plus interned names and analysis previews. A table is built
+once per data snapshot and shared read-only by every session; filters and
+counts run vectorized over the columns, and rows are still available as the
+usual (id, name, lat, lon, risk, analysis_preview) tuples.
+"""
+
+import sys
+
+import numpy as np
+
+# Known risk levels get fixed codes; any other value found in the data is appended
+RISK_LEVELS = ("high", "medium", "low")
+
+
+class ShopTable:
+    """Read-only columnar table of shop listing rows with an id-to-row index"""
+
+    def __init__(self, ids, names, lats, lons, risk_codes, risk_levels, previews):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.risk_codes = np.asarray(risk_codes, dtype=np.int8)
+        self.risk_levels = tuple(risk_levels)
+        self.names = tuple(names)
+        self.previews = tuple(previews)
+        for column in (self.ids, self.lats, self.lons, self.risk_codes):
+            column.flags.writeable = False
+        self._positions = {shop_id: pos for pos, shop_id in enumerate(self.ids.tolist())}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a table from (id, name, lat, lon, risk, analysis_preview) rows"""
+        rows = rows if isinstance(rows, (list, tuple)) else list(rows)
+        levels = list(RISK_LEVELS)
+        codes = {level: code for code, level in enumerate(levels)}
+
+        def risk_code(risk):
+            risk = (risk or "").lower()
+            if risk not in codes:
+                codes[risk] = len(levels)
+                levels.append(risk)
+            return codes[risk]
+
+        n = len(rows)
+        return cls(
+            ids=np.fromiter((row[0] for row in rows), dtype=np.int64, count=n),
+            names=(sys.intern(row[1]) for row in rows),
+            lats=np.fromiter((float(row[2]) for row in rows), dtype=np.float64, count=n),
+            lons=np.fromiter((float(row[3]) for row in rows), dtype=np.float64, count=n),
+            risk_codes=np.fromiter((risk_code(row[4]) for row in rows), dtype=np.int8, count=n),
+            risk_levels=levels,
+            previews=(row[5] for row in rows),
+        )
+
+    def merge(self, rows, deleted_ids=()):
+        """New table with listing rows inserted or replaced by id and deleted_ids dropped, in id order"""
+        changed = ShopTable.from_rows(rows)
+        levels = list(self.risk_levels)
+        levels += [level for level in changed.risk_levels if level not in levels]
+        remap = np.array([levels.index(level) for level in changed.risk_levels], dtype=np.int8)
+        gone = np.concatenate([changed.ids, np.asarray(list(deleted_ids), dtype=np.int64)])
+        kept = np.flatnonzero(~np.isin(self.ids, gone))
+        if len(kept) == len(self):
+            names, previews = self.names, self.previews
+        else:
+            names = [self.names[pos] for pos in kept]
+            previews = [self.previews[pos] for pos in kept]
+        ids = np.concatenate([self.ids[kept], changed.ids])
+        lats = np.concatenate([self.lats[kept], changed.lats])
+        lons = np.concatenate([self.lons[kept], changed.lons])
+        risk_codes = np.concatenate([self.risk_codes[kept], remap[changed.risk_codes]])
+        names, previews = tuple(names) + changed.names, tuple(previews) + changed.previews
+        if len(ids) > 1 and not (ids[1:] > ids[:-1]).all():  # only appends keep the id order as is
+            order = np.argsort(ids, kind="stable")
+            ids, lats, lons, risk_codes = ids[order], lats[order], lons[order], risk_codes[order]
+            names = [names[pos] for pos in order]
+            previews = [previews[pos] for pos in order]
+        return ShopTable(ids, names, lats, lons, risk_codes, levels, previews)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, pos):
+        return (
+            int(self.ids[pos]), self.names[pos], float(self.lats[pos]), float(self.lons[pos]),
+            self.risk_levels[self.risk_codes[pos]], self.previews[pos],
+        )
+
+    def __iter__(self):
+        return (self[pos] for pos in range(len(self)))
+
+    def position(self, shop_id):
+        """Row position of a shop id, or None"""
+        return self._positions.get(shop_id)
+
+    def get(self, shop_id):
+        """Row tuple for a shop id, or None"""
+        pos = self._positions.get(shop_id)
+        return None if pos is None else self[pos]
+
+    def mask(self, risk_levels=None, bbox=None):
+        """Boolean row mask for a set of risk levels and an optional (min_lat, min_lon, max_lat, max_lon) box"""
+        selected = np.ones(len(self), dtype=bool)
+        if risk_levels is not None:
+            wanted = {level.lower() for level in risk_levels}
+            codes = [code for code, level in enumerate(self.risk_levels) if level in wanted]
+            selected &= np.isin(self.risk_codes, codes)
+        if bbox is not None:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            selected &= (self.lats >= min_lat) & (self.lats <= max_lat) & (self.lons >= min_lon) & (self.lons <= max_lon)
+        return selected
+
+    def rows(self, mask=None):
+        """Row tuples, optionally only those selected by a boolean mask"""
+        positions = range(len(self)) if mask is None else np.flatnonzero(mask)
+        return [self[pos] for pos in positions]
+
+    def risk_counts(self, mask=None):
+        """Number of shops per risk level, optionally only those selected by a boolean mask"""
+        codes = self.risk_codes if mask is None else self.risk_codes[mask]
+        counts = np.bincount(codes, minlength=len(self.risk_levels))
+        return {level: int(count) for level, count in zip(self.risk_levels, counts)}
+
+
+EMPTY_SHOP_TABLE = ShopTable.from_rows(())
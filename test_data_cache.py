@@ -0,0 +1,66 @@
+from collections import Counter
+
+from data_cache import EMPTY_SNAPSHOT, apply_changes
+from db import Changes
+
+CENTERS = [(1, "North", 33.0, -97.0), (2, "South", 32.0, -96.0)]
+SHOPS = [
+    (10, "Ten", 33.01, -97.01, "high", "p"),
+    (11, "Eleven", 32.01, -96.01, "low", "p"),
+    (12, "Twelve", 33.02, -97.02, "medium", "p"),
+]
+SHOP_CENTERS = {10: 1, 11: 2, 12: 1}
+
+
+def recounted(snapshot, shop_centers):
+    """Risk counts of a snapshot's shops computed from scratch"""
+    totals, centers = Counter(), {}
+    for shop in snapshot.shops:
+        totals[shop[4]] += 1
+        centers.setdefault(shop_centers[shop[0]], Counter())[shop[4]] += 1
+    return dict(totals), {center_id: dict(counts) for center_id, counts in centers.items()}
+
+
+def counts(snapshot):
+    return dict(snapshot.risk_counts), {
+        center_id: dict(counts) for center_id, counts in snapshot.center_risk_counts.items() if counts
+    }
+
+
+def loaded():
+    return apply_changes(EMPTY_SNAPSHOT, Changes(CENTERS, SHOPS, [], [], dict(SHOP_CENTERS), 1))
+
+
+def test_apply_changes_adjusts_risk_counts():
+    changes = Changes(
+        [], [(11, "Eleven", 32.01, -96.01, "high", "p"), (13, "Thirteen", 32.02, -96.02, "low", "p")],
+        [], [12], {11: 2, 12: 1, 13: 2}, 5,
+    )
+    snapshot = apply_changes(loaded(), changes)
+
+    assert [shop[0] for shop in snapshot.shops] == [10, 11, 13]
+    assert counts(snapshot) == recounted(snapshot, {10: 1, 11: 2, 13: 2})
+    assert snapshot.watermark == 5
+
+
+def test_apply_changes_twice_is_idempotent():
+    # A transaction still running at the last sync holds the watermark back, so its rows are read again
+    changes = Changes(
+        [(3, "East", 32.5, -95.0)], [(10, "Ten", 33.01, -97.01, "low", "p"), (14, "Fourteen", 32.5, -95.01, "high", "p")],
+        [2], [11], {10: 1, 11: 2, 14: 3}, 7,
+    )
+    once = apply_changes(loaded(), changes)
+    twice = apply_changes(once, changes)
+
+    assert list(twice.shops) == list(once.shops)
+    assert twice.centers == once.centers == (CENTERS[0], (3, "East", 32.5, -95.0))
+    assert counts(twice) == counts(once) == recounted(once, {10: 1, 12: 1, 14: 3})
+
+
+def test_apply_changes_without_changes_keeps_indexes():
+    snapshot = loaded()
+    synced = apply_changes(snapshot, Changes([], [], [], [], {}, 9))
+
+    assert synced.shops is snapshot.shops
+    assert synced.center_locator is snapshot.center_locator
+    assert synced.watermark == 9
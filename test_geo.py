@@ -0,0 +1,23 @@
+import random
+import sqlite3
+
+from geo import geohash_encode, geohash_encode_many
+from migrate import geohash_sql
+
+
+def test_geohash_known_value():
+    assert geohash_encode(57.64911, 10.40744) == "u4pruydqq"
+
+
+def test_geohash_encode_many_matches_sqlite_expression():
+    rng = random.Random(7)
+    points = [(-90.0, -180.0), (90.0, 180.0), (0.0, 0.0), (32.7767, -96.797), (-33.8688, 151.2093)]
+    points += [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(500)]
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE points (id INTEGER PRIMARY KEY, lat REAL, lon REAL)")
+    conn.executemany("INSERT INTO points (lat, lon) VALUES (?, ?)", points)
+    in_sql = [row[0] for row in conn.execute(f"SELECT {geohash_sql('lat', 'lon', 'sqlite')} FROM points ORDER BY id")]
+    conn.close()
+
+    assert geohash_encode_many([lat for lat, _ in points], [lon for _, lon in points]) == in_sql
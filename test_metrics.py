@@ -0,0 +1,28 @@
+import os
+import threading
+
+import metrics
+
+
+def test_write_prometheus_concurrent_writers(tmp_path):
+    path = tmp_path / "walmart.prom"
+    errors = []
+    start = threading.Barrier(8)
+
+    def write_many():
+        start.wait()
+        for _ in range(100):
+            try:
+                metrics.finish_rerun(metrics.begin_rerun("test"), prometheus_path=str(path))
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=write_many) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert "walmart_reruns_total" in path.read_text()
+    assert os.listdir(tmp_path) == ["walmart.prom"]  # no temporary files left behind
@@ -0,0 +1,38 @@
+from shop_table import ShopTable
+
+ROWS = [
+    (1, "Alpha", 32.70, -96.80, "High", "a"),
+    (2, "Bravo", 32.71, -96.81, "low", "b"),
+    (3, "Charlie", 32.72, -96.82, "medium", "c"),
+]
+
+
+def test_merge_inserts_replaces_and_deletes():
+    table = ShopTable.from_rows(ROWS)
+    merged = table.merge(
+        [(0, "Zero", 32.69, -96.79, "low", "z"), (2, "Bravo 2", 32.9, -96.9, "high", "b2"), (5, "Echo", 32.75, -96.85, "medium", "e")],
+        deleted_ids=[3],
+    )
+
+    assert list(merged) == [
+        (0, "Zero", 32.69, -96.79, "low", "z"),
+        (1, "Alpha", 32.70, -96.80, "high", "a"),
+        (2, "Bravo 2", 32.9, -96.9, "high", "b2"),
+        (5, "Echo", 32.75, -96.85, "medium", "e"),
+    ]
+    assert merged.get(3) is None
+    assert merged.get(2) == (2, "Bravo 2", 32.9, -96.9, "high", "b2")
+    assert list(table) == list(ShopTable.from_rows(ROWS))  # the original table is left as is
+
+
+def test_merge_keeps_new_risk_levels():
+    merged = ShopTable.from_rows(ROWS).merge([(4, "Delta", 32.73, -96.83, "Critical", "d")])
+
+    assert merged.get(4)[4] == "critical"
+    assert merged.get(1)[4] == "high"
+
+
+def test_merge_unknown_delete_is_a_no_op():
+    table = ShopTable.from_rows(ROWS)
+
+    assert list(table.merge([], deleted_ids=[42])) == list(table)